@@ -1,17 +1,27 @@
 import os
+import sys
+import asyncio
 import certifi
 import json
-import requests
+import time
 import pandas as pd
+import requests
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from io import StringIO, BytesIO
 
-import boto3
 import discord
 from discord.ext import commands
 from discord import app_commands
 from discord.ui import Select, View
 from dotenv import load_dotenv
 
+# Make the repo-level common/ package importable when run from this folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.aura_costs import fill_missing_costs, first_cogs_by_asin
+from common.sheet_client import fetch_sheet_text
+from common.storage import get_s3_client, upload_stream
+
 # Point to the certifi certificate bundle (useful on macOS)
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
@@ -24,6 +34,18 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 CONFIG_S3_BUCKET = os.getenv("CONFIG_S3_BUCKET")
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 
+# Heavy commands (/upload, /updateaura) run in worker threads so the event loop stays free
+BOT_MAX_JOBS = int(os.getenv("BOT_MAX_JOBS", "2"))
+BOT_MAX_QUEUED_JOBS = int(os.getenv("BOT_MAX_QUEUED_JOBS", "10"))
+BOT_JOBS_PER_USER = int(os.getenv("BOT_JOBS_PER_USER", "1"))
+
+# Parsed cost sheets are kept in memory for repeat /updateaura runs
+BOT_SHEET_CACHE_TTL = float(os.getenv("BOT_SHEET_CACHE_TTL", "600"))
+BOT_SHEET_CACHE_SIZE = int(os.getenv("BOT_SHEET_CACHE_SIZE", "8"))
+
+# Attachments are read from the Discord CDN in chunks of this size while uploading
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+
 # Ensure AWS credentials are provided
 if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
     raise Exception("AWS credentials not found. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in your .env file.")
@@ -33,25 +55,181 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+###########################################
+# Job Queue for Heavy Commands            #
+###########################################
+
+class JobRejected(Exception):
+    """Raised when a command can't be queued (queue full or user limit reached)."""
+
+
+class JobQueue:
+    """
+    Bounds heavy work: at most max_running blocking steps run in threads at once,
+    at most max_queued commands are in flight, and each user gets per_user of them.
+    Only touched from the event loop, so the counters need no lock.
+    """
+
+    def __init__(self, max_running, max_queued, per_user):
+        self.slots = asyncio.Semaphore(max_running)
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self.queued = 0
+        self.user_jobs = {}
+
+    @asynccontextmanager
+    async def admit(self, user_id):
+        if self.queued >= self.max_queued:
+            raise JobRejected("The bot is busy with other jobs right now. Please try again in a minute.")
+        if self.user_jobs.get(user_id, 0) >= self.per_user:
+            raise JobRejected("You already have a job running. Please wait for it to finish.")
+        self.queued += 1
+        self.user_jobs[user_id] = self.user_jobs.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            self.queued -= 1
+            self.user_jobs[user_id] -= 1
+            if not self.user_jobs[user_id]:
+                del self.user_jobs[user_id]
+
+    async def run(self, interaction, func, *args):
+        """Runs a blocking function in a worker thread once a slot is free."""
+        if self.slots.locked():
+            await report_progress(interaction, f"Waiting for a free worker ({self.queued} job(s) in flight)...")
+        async with self.slots:
+            return await asyncio.to_thread(func, *args)
+
+
+jobs = JobQueue(BOT_MAX_JOBS, BOT_MAX_QUEUED_JOBS, BOT_JOBS_PER_USER)
+
+
+async def report_progress(interaction, text):
+    """
+    Shows progress by editing the deferred response. Failures are only logged.
+    """
+    try:
+        await interaction.edit_original_response(content=text)
+    except discord.HTTPException as e:
+        print(f"Could not update progress for {interaction.user}: {e}")
+
+###########################################
+# Cost Sheet Cache                        #
+###########################################
+
+class CostSheetCache:
+    """
+    In-memory LRU of ASIN -> COGS maps keyed by sheet URL. Entries expire after
+    ttl seconds and the least recently used one is evicted past max_entries.
+    Only touched from the event loop, so no lock is needed.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, url):
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        stored_at, cogs_by_asin = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[url]
+            return None
+        self.entries.move_to_end(url)
+        return cogs_by_asin
+
+    def put(self, url, cogs_by_asin):
+        self.entries[url] = (time.monotonic(), cogs_by_asin)
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, url=None):
+        """Drops one sheet, or every sheet when url is None. Returns how many were dropped."""
+        if url is None:
+            dropped = len(self.entries)
+            self.entries.clear()
+            return dropped
+        return 1 if self.entries.pop(url, None) is not None else 0
+
+
+cost_sheets = CostSheetCache(BOT_SHEET_CACHE_TTL, BOT_SHEET_CACHE_SIZE)
+
 ###########################################
 # S3 Uploader Functionality (for /upload)  #
 ###########################################
 
-def upload_file_to_s3(file_bytes, file_name):
+def upload_file_to_s3(file_url, file_name):
     """
-    Uploads file bytes to AWS S3 with the specified file name.
+    Streams a file from its URL (the Discord CDN) to AWS S3 with the specified file name.
+    Large files go up as a multipart upload, so the bot never holds the whole file.
     """
-    s3_client = boto3.client(
-        's3',
+    s3_client = get_s3_client(
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
     )
     try:
-        s3_client.put_object(Bucket=CONFIG_S3_BUCKET, Key=file_name, Body=file_bytes)
-        return f"Successfully uploaded '{file_name}' to bucket '{CONFIG_S3_BUCKET}'."
+        with requests.get(file_url, stream=True, timeout=(10, 60)) as response:
+            response.raise_for_status()
+            stats = upload_stream(
+                CONFIG_S3_BUCKET,
+                file_name,
+                response.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE),
+                s3_client=s3_client
+            )
+        size_mb = stats["bytes"] / (1024 * 1024)
+        throughput = size_mb / stats["seconds"] if stats["seconds"] else 0.0
+        print(f"Uploaded {file_name}: {size_mb:.1f} MB in {stats['parts']} part(s), "
+              f"{stats['seconds']:.1f}s ({throughput:.1f} MB/s)")
+        return (f"Successfully uploaded '{file_name}' to bucket '{CONFIG_S3_BUCKET}' "
+                f"({size_mb:.1f} MB at {throughput:.1f} MB/s).")
     except Exception as e:
         return f"Error uploading '{file_name}' to S3: {e}"
 
+###########################################
+# Aura Cost Update (for /updateaura)      #
+###########################################
+
+def read_aura_csv(aura_bytes):
+    return pd.read_csv(StringIO(aura_bytes.decode('utf-8')))
+
+
+def fetch_cost_sheet(google_sheet_url):
+    return pd.read_csv(StringIO(fetch_sheet_text(google_sheet_url)), dtype=str)
+
+
+def normalize_cost_sheet(sheet_df, mapping):
+    """
+    Renames the mapped columns to ASIN/COGS, parses COGS as a number and returns
+    the first-match ASIN -> COGS map.
+    """
+    sheet_df = sheet_df.rename(columns={mapping["ASIN"]: "ASIN", mapping["COGS"]: "COGS"})
+    sheet_df["ASIN"] = sheet_df["ASIN"].astype(str).str.strip()
+    sheet_df["COGS"] = (
+        sheet_df["COGS"]
+        .astype(str)
+        .str.replace('$', '', regex=False)
+        .str.replace(',', '', regex=False)
+    )
+    sheet_df["COGS"] = pd.to_numeric(sheet_df["COGS"], errors='coerce')
+    return first_cogs_by_asin(sheet_df)
+
+
+def update_aura_costs(aura_df, cogs_by_asin):
+    """
+    Fills missing aura costs from the ASIN -> COGS map and returns (csv bytes, updated rows).
+    """
+    aura_df["asin"] = aura_df["asin"].astype(str).str.strip()
+    aura_df["cost"] = pd.to_numeric(aura_df["cost"], errors='coerce')
+
+    updated_rows = fill_missing_costs(aura_df, cogs_by_asin)
+
+    output_buffer = StringIO()
+    aura_df.to_csv(output_buffer, index=False)
+    return output_buffer.getvalue().encode('utf-8'), updated_rows
+
 ###########################################
 # Dropdown UI for Column Mapping         #
 ###########################################
@@ -94,17 +272,21 @@ async def slash_upload(interaction: discord.Interaction, file: discord.Attachmen
     Slash command to upload a file to S3.
     The result is sent to the executor via DM, with an ephemeral notification in the channel.
     """
+    await interaction.response.defer()
     try:
-        file_bytes = await file.read()
-        result = upload_file_to_s3(file_bytes, file.filename)
-        embed = discord.Embed(
-            title="S3 Upload Result",
-            description=result,
-            color=discord.Color.blue()
-        )
-        await interaction.response.send_message(embed=embed)
+        async with jobs.admit(interaction.user.id):
+            await report_progress(interaction, f"Uploading **{file.filename}** ({file.size / (1024 * 1024):.1f} MB) to S3...")
+            result = await jobs.run(interaction, upload_file_to_s3, file.url, file.filename)
+            embed = discord.Embed(
+                title="S3 Upload Result",
+                description=result,
+                color=discord.Color.blue()
+            )
+            await interaction.edit_original_response(content=None, embed=embed)
+    except JobRejected as e:
+        await interaction.followup.send(str(e), ephemeral=True)
     except Exception as e:
-        await interaction.response.send_message(f"Error processing the file: {e}", ephemeral=True)
+        await interaction.followup.send(f"Error processing the file: {e}", ephemeral=True)
 
 @bot.tree.command(name="updateaura", description="Update aura CSV with cost data from a Google Sheet")
 @app_commands.describe(
@@ -118,29 +300,73 @@ async def slash_updateaura(interaction: discord.Interaction, aura_file: discord.
     """
     await interaction.response.defer()
     try:
+        async with jobs.admit(interaction.user.id):
+            await update_aura(interaction, aura_file, google_sheet_url)
+    except JobRejected as e:
+        await interaction.followup.send(str(e), ephemeral=True)
+
+
+async def update_aura(interaction, aura_file, google_sheet_url):
+    """
+    Body of /updateaura. Parsing, fetching and the cost fill run through the job queue.
+    """
+    try:
+        await report_progress(interaction, "Reading aura CSV...")
         aura_bytes = await aura_file.read()
-        aura_df = pd.read_csv(StringIO(aura_bytes.decode('utf-8')))
+        aura_df = await jobs.run(interaction, read_aura_csv, aura_bytes)
     except Exception as e:
         await interaction.followup.send(f"Error reading aura CSV file: {e}", ephemeral=True)
         return
 
+    google_sheet_url = google_sheet_url.strip() if google_sheet_url else configured_sheet_url()
     if not google_sheet_url:
-        if os.path.exists("config.json"):
-            with open("config.json", "r") as f:
-                config = json.load(f)
-            google_sheet_url = config.get("google_sheet_url", "").strip()
-        if not google_sheet_url:
-            await interaction.followup.send("Google Sheet URL not provided and no config.json found.", ephemeral=True)
+        await interaction.followup.send("Google Sheet URL not provided and no config.json found.", ephemeral=True)
+        return
+
+    cogs_by_asin = cost_sheets.get(google_sheet_url)
+    if cogs_by_asin is None:
+        cogs_by_asin = await load_cost_sheet(interaction, google_sheet_url)
+        if cogs_by_asin is None:
             return
+        cost_sheets.put(google_sheet_url, cogs_by_asin)
+
+    if "asin" not in aura_df.columns or "cost" not in aura_df.columns:
+        await interaction.followup.send("The aura CSV file must have both 'asin' and 'cost' columns.", ephemeral=True)
+        return
+
+    await report_progress(interaction, "Updating costs...")
+    output_bytes, updated_rows = await jobs.run(interaction, update_aura_costs, aura_df, cogs_by_asin)
+
+    embed = discord.Embed(
+        title="Aura CSV Update Summary",
+        description=f"Updated **{len(updated_rows)}** row(s) in the aura CSV file.",
+        color=discord.Color.green()
+    )
+    await report_progress(interaction, f"Done. Updated {len(updated_rows)} row(s).")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+    await interaction.user.send("Aura Updated File", file=discord.File(fp=BytesIO(output_bytes), filename="aura_updated.csv"))
+
+
+def configured_sheet_url():
+    """Returns the default Google Sheet URL from config.json, or an empty string."""
+    if not os.path.exists("config.json"):
+        return ""
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    return config.get("google_sheet_url", "").strip()
 
+
+async def load_cost_sheet(interaction, google_sheet_url):
+    """
+    Fetches a cost sheet, asks for the ASIN/COGS columns if they can't be detected and
+    returns its ASIN -> COGS map. Returns None after telling the user what went wrong.
+    """
     try:
-        response = requests.get(google_sheet_url)
-        response.raise_for_status()
-        csv_data = StringIO(response.text)
-        sheet_df = pd.read_csv(csv_data, dtype=str)
+        await report_progress(interaction, "Fetching Google Sheet...")
+        sheet_df = await jobs.run(interaction, fetch_cost_sheet, google_sheet_url)
     except Exception as e:
         await interaction.followup.send(f"Error fetching Google Sheet data: {e}", ephemeral=True)
-        return
+        return None
 
     # Auto-detect mapping for ASIN and COGS (case-insensitive)
     sheet_columns = list(sheet_df.columns)
@@ -163,56 +389,23 @@ async def slash_updateaura(interaction: discord.Interaction, aura_file: discord.
         await view.wait()
         if not view.mapping_result or len(view.mapping_result) < len(missing):
             await interaction.followup.send("Column mapping not completed in time. Please try the command again.", ephemeral=True)
-            return
+            return None
         mapping.update(view.mapping_result)
 
     try:
-        sheet_df = sheet_df.rename(columns={mapping["ASIN"]: "ASIN", mapping["COGS"]: "COGS"})
-        sheet_df["ASIN"] = sheet_df["ASIN"].astype(str).str.strip()
-        sheet_df["COGS"] = (
-            sheet_df["COGS"]
-            .astype(str)
-            .str.replace('$', '', regex=False)
-            .str.replace(',', '', regex=False)
-        )
-        sheet_df["COGS"] = pd.to_numeric(sheet_df["COGS"], errors='coerce')
+        return await jobs.run(interaction, normalize_cost_sheet, sheet_df, mapping)
     except Exception as e:
         await interaction.followup.send(f"Error processing Google Sheet data: {e}", ephemeral=True)
-        return
-
-    if "asin" not in aura_df.columns or "cost" not in aura_df.columns:
-        await interaction.followup.send("The aura CSV file must have both 'asin' and 'cost' columns.", ephemeral=True)
-        return
-    aura_df["asin"] = aura_df["asin"].astype(str).str.strip()
-    aura_df["cost"] = pd.to_numeric(aura_df["cost"], errors='coerce')
+        return None
 
-    updated_rows = []
-    for idx, row in aura_df.iterrows():
-        if pd.isna(row["cost"]):
-            match = sheet_df[sheet_df["ASIN"] == row["asin"]]
-            if not match.empty:
-                new_cost = match.iloc[0]["COGS"]
-                if not pd.isna(new_cost):
-                    aura_df.at[idx, "cost"] = new_cost
-                    updated_rows.append({
-                        "index": idx,
-                        "asin": row["asin"],
-                        "old_cost": row["cost"],
-                        "new_cost": new_cost
-                    })
-
-    output_buffer = StringIO()
-    aura_df.to_csv(output_buffer, index=False)
-    output_bytes = output_buffer.getvalue().encode('utf-8')
-
-    embed = discord.Embed(
-        title="Aura CSV Update Summary",
-        description=f"Updated **{len(updated_rows)}** row(s) in the aura CSV file.",
-        color=discord.Color.green()
-    )
-    file = discord.File(fp=BytesIO(output_bytes), filename="aura_updated.csv")
-    await interaction.followup.send(embed=embed, ephemeral=True)
-    await interaction.user.send("Aura Updated File", file=discord.File(fp=BytesIO(output_bytes), filename="aura_updated.csv"))
+@bot.tree.command(name="refreshsheet", description="Clear cached Google Sheet cost data")
+@app_commands.describe(google_sheet_url="Optional: only clear this Google Sheet (default: clear all)")
+async def slash_refreshsheet(interaction: discord.Interaction, google_sheet_url: str = None):
+    """
+    Slash command to drop cached cost sheets so the next /updateaura fetches them again.
+    """
+    dropped = cost_sheets.invalidate(google_sheet_url.strip() if google_sheet_url else None)
+    await interaction.response.send_message(f"Cleared **{dropped}** cached sheet(s).", ephemeral=True)
 
 ###########################################
 # on_ready Event (after command definitions)
@@ -1,11 +1,17 @@
 import json
 import os
+import sys
 import requests
 import pandas as pd
 from io import StringIO
 import tkinter as tk
 from tkinter import filedialog
 
+# Make the repo-level common/ package importable when run from this folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common.aura_costs import fill_missing_costs, first_cogs_by_asin
+from common.sheet_client import fetch_sheet_text
+
 # ANSI color codes (will be ignored on unsupported terminals)
 GREEN = "\033[92m"
 YELLOW = "\033[93m"
@@ -56,9 +62,7 @@ def prompt_google_sheet_url():
 def fetch_google_sheet(url):
     print_section_header("Fetching Google Sheet Data")
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        csv_data = StringIO(response.text)
+        csv_data = StringIO(fetch_sheet_text(url))
         df = pd.read_csv(csv_data, dtype=str)
         print(f"{GREEN}Google Sheet data fetched successfully.{RESET}")
         return df
@@ -200,20 +204,7 @@ def main():
     sheet_df['ASIN'] = sheet_df['ASIN'].astype(str).str.strip()
     aura_df['cost'] = pd.to_numeric(aura_df['cost'], errors='coerce')
     
-    updated_rows = []
-    for index, row in aura_df.iterrows():
-        if pd.isna(row['cost']):
-            match = sheet_df[sheet_df['ASIN'] == row['asin']]
-            if not match.empty:
-                new_cost = match.iloc[0]['COGS']
-                if not pd.isna(new_cost):
-                    aura_df.at[index, 'cost'] = float(new_cost)
-                    updated_rows.append({
-                        'index': index,
-                        'asin': row['asin'],
-                        'old_cost': row['cost'],
-                        'new_cost': float(new_cost)
-                    })
+    updated_rows = fill_missing_costs(aura_df, first_cogs_by_asin(sheet_df))
     
     # Save updated CSV in the START HERE folder
     script_dir = os.path.dirname(os.path.abspath(__file__))
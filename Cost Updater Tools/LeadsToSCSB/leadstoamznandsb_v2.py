@@ -1,26 +1,56 @@
-import pandas as pd
 import random
 import string
-from dotenv import load_dotenv
 import os
-import requests
+import sys
 import io
-from io import StringIO, BytesIO
-from openpyxl import load_workbook
-import boto3
+from io import BytesIO
 import json
-import smtplib
-import ssl
+import hashlib
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from email.message import EmailMessage
 
-# Load environment variables
-load_dotenv()
+# Make the repo-level common/ package importable when run from this folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+# Imported first so the cold start timer covers the rest of init
+from common.runtime import load_local_env, record_cold_start
+from common.attachments import add_attachments, prepare_attachments
+from common.cogs_report import REPORT_CSV_FILENAME, render_report, report_csv, report_detail, report_truncated
+from common.leads_cache import fetch_leads, get_leads_cache
+from common.mailer import Mailer
+from common.metrics import StageMetrics
+from common.sheet_cache import get_sheet_cache
+from common.storage import get_etag, get_s3_client, read_bytes, read_json, write_bytes, write_json
+
+# pandas, openpyxl and the pandas-based helpers (common.row_index) are imported
+# inside the functions that use them, so cold starts and runs where no sheet
+# changed never load them.
+
+# Load environment variables (local runs only; Lambda uses the function's environment)
+load_local_env()
 
 # Common configuration variables
 CONFIG_S3_BUCKET = os.getenv("CONFIG_S3_BUCKET")
 LISTING_LOADER_KEY = "listingLoaderTemplate.xlsm"
+LISTING_LOADER_COLUMNS = [
+    'Your Search Term', "Amazon's Title", 'Record Action', 'Seller SKU',
+    'Merchant Suggested ASIN', 'Offering Condition Type', 'Fulfillment Channel Code (US)',
+    'Your Price USD (Sell on Amazon, US)', 'Recommended Action'
+]
+# "write_only" streams the Sellerboard xlsx row by row; "pandas" uses DataFrame.to_excel
+SB_XLSX_WRITER = os.getenv("SB_XLSX_WRITER", "write_only")
+# Parquet snapshots of the Sellerboard catalogs need pyarrow; without it only the xlsx is used
+SB_SNAPSHOTS_ENABLED = importlib.util.find_spec("pyarrow") is not None
+# "full" emails the whole catalog; "delta" emails only the rows added or costed in the run
+SB_EXPORT_MODE = os.getenv("SB_EXPORT_MODE", "full")
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+# Number of users processed in parallel; set to 1 to run users one at a time
+USER_CONCURRENCY = int(os.getenv("USER_CONCURRENCY", "4"))
+
+# One SMTP connection per invocation, shared by all user pipelines (closed by the handler)
+mailer = Mailer(EMAIL_ADDRESS, EMAIL_PASSWORD)
 
 users_config = [
     {
@@ -46,152 +76,90 @@ users_config = [
     }
 ]
 
-if not any(user["sheet_url"] for user in users_config):
-    raise ValueError("At least one user sheet URL must be set.")
+def validate_users_config():
+    """Checked per invocation rather than at import so a bad config doesn't fail the container's init."""
+    if not any(user["sheet_url"] for user in users_config):
+        raise ValueError("At least one user sheet URL must be set.")
+
+# Listing Loader template state kept across warm Lambda invocations. The S3 ETag
+# decides when the cached bytes are stale; "workbooks" holds parsed copies whose
+# appended rows are rolled back after each user so they can be reused.
+listing_loader_lock = threading.Lock()
+listing_loader_cache = {
+    "etag": None,
+    "bytes": None,
+    "headers": None,
+    "col_indices": None,
+    "template_rows": 0,
+    "workbooks": []
+}
 
 def get_last_processed_date():
-    s3_client = boto3.client('s3')
     config_key = "amznUploadConfig.json"
     try:
-        response = s3_client.get_object(Bucket=CONFIG_S3_BUCKET, Key=config_key)
-        config_data = json.loads(response['Body'].read().decode('utf-8'))
+        config_data = read_json(CONFIG_S3_BUCKET, config_key)
         return config_data.get("last_processed_date", "2000-01-01")
     except Exception as e:
         print(f"Error fetching last processed date: {e}")
         return "2000-01-01"
 
 def update_last_processed_date(new_date):
-    s3_client = boto3.client('s3')
     config_key = "amznUploadConfig.json"
-    new_config = json.dumps({"last_processed_date": new_date})
     try:
-        s3_client.put_object(Bucket=CONFIG_S3_BUCKET, Key=config_key, Body=new_config)
+        write_json(CONFIG_S3_BUCKET, config_key, {"last_processed_date": new_date})
         print(f"Updated last processed date to: {new_date} in S3.")
     except Exception as e:
         print(f"Error updating last processed date: {e}")
 
-def send_email(attachments, recipient_email, potential_updates, new_products, actual_updates):
+def send_email(attachments, recipient_email, potential_updates, new_products, actual_updates, metrics=None):
     """
     Sends email with multiple attachments and a report.
-    attachments: list of tuples (BytesIO_object, filename)
+    attachments: list of tuples (bytes or BytesIO, filename). Attachments too large
+    for the email are sent as S3 download links (see common.attachments).
     """
+    metrics = metrics or StageMetrics()
     msg = EmailMessage()
     msg['From'] = EMAIL_ADDRESS
     msg['To'] = recipient_email
     msg['Subject'] = "Amazon New Listings & COGS Report"
     
-    # Build HTML email content
-    html_content = """<html>
-    <body>
-        <h2 style="color: #2c3e50;">Amazon New Listings & COGS Report</h2>
-        <div style="margin-bottom: 30px;">"""
-    
-    if actual_updates:
-        html_content += """
-        <h3 style="color: #34495e;">Completed Cost Updates</h3>
-        <table style="border-collapse: collapse; width: 100%; margin-bottom: 20px;">
-            <tr style="background-color: #f8f9fa;">
-                <th style="padding: 12px; border: 1px solid #ddd;">ASIN</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">SKU</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">Name</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">New Cost</th>
-            </tr>"""
-        for update in actual_updates:
-            html_content += f"""
-            <tr>
-                <td style="padding: 12px; border: 1px solid #ddd;">{update['ASIN']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">{update['SKU']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">{update['Name']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">${update['new_cost']:.2f}</td>
-            </tr>"""
-        html_content += "</table>"
-    
-    if potential_updates:
-        html_content += """
-        <h3 style="color: #34495e;">Potential COGS Updates</h3>
-        <table style="border-collapse: collapse; width: 100%; margin-bottom: 20px;">
-            <tr style="background-color: #f8f9fa;">
-                <th style="padding: 12px; border: 1px solid #ddd;">ASIN</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">SKU</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">Name</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">Old Cost</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">New Cost</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">Difference</th>
-            </tr>"""
-        for update in potential_updates:
-            diff = update['new_cost'] - update['old_cost']
-            diff_color = "#e74c3c" if diff > 0 else "#27ae60"
-            html_content += f"""
-            <tr>
-                <td style="padding: 12px; border: 1px solid #ddd;">{update['ASIN']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">{update['SKU']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">{update['Name']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">${update['old_cost']:.2f}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">${update['new_cost']:.2f}</td>
-                <td style="padding: 12px; border: 1px solid #ddd; color: {diff_color};">
-                    {diff:+.2f}
-                </td>
-            </tr>"""
-        html_content += "</table>"
-    
-    if new_products:
-        html_content += """
-        <h3 style="color: #34495e;">New Products Added</h3>
-        <table style="border-collapse: collapse; width: 100%;">
-            <tr style="background-color: #f8f9fa;">
-                <th style="padding: 12px; border: 1px solid #ddd;">ASIN</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">SKU</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">Name</th>
-                <th style="padding: 12px; border: 1px solid #ddd;">Initial Cost</th>
-            </tr>"""
-        for product in new_products:
-            html_content += f"""
-            <tr>
-                <td style="padding: 12px; border: 1px solid #ddd;">{product['ASIN']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">{product['SKU']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">{product['Name']}</td>
-                <td style="padding: 12px; border: 1px solid #ddd;">${product['cost']:.2f}</td>
-            </tr>"""
-        html_content += "</table>"
-    
-    html_content += """
-        </div>
-        <p style="color: #7f8c8d;">
-            Note: Potential COGS updates are suggestions only. No actual changes have been made to existing items.
-            <br>Attached files contain new product listings and updated prices within Sellerboard.
-        </p>
-    </body>
-    </html>"""
-    
+    # Tables are capped at REPORT_MAX_ROWS; the full detail then goes out as a CSV
+    if report_truncated(actual_updates, potential_updates, new_products):
+        detail_csv = report_csv(actual_updates, potential_updates, new_products)
+        attachments = attachments + [(detail_csv, REPORT_CSV_FILENAME)]
+    try:
+        files, links = prepare_attachments(attachments, CONFIG_S3_BUCKET, metrics)
+    except Exception as e:
+        # The report still goes out, without the attachments
+        print(f"Failed to prepare attachments for {recipient_email}: {e}")
+        files, links = [], []
+    with metrics.stage("report_render"):
+        html_content = render_report(
+            actual_updates, potential_updates, new_products, links, detail=report_detail(files, links)
+        )
+    metrics.count("report_html_bytes", len(html_content.encode("utf-8")))
     msg.add_alternative(html_content, subtype='html')
-    
-    for attachment_data, attachment_filename in attachments:
-        attachment_data.seek(0)
-        try:
-            msg.add_attachment(
-                attachment_data.read(),
-                filename=attachment_filename,
-                maintype="application",
-                subtype="octet-stream"
-            )
-        except Exception as e:
-            print(f"Failed to add attachment {attachment_filename}: {e}")
+    try:
+        add_attachments(msg, files)
+    except Exception as e:
+        print(f"Failed to add attachments: {e}")
     
     try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
+        with metrics.stage("smtp_send"):
+            mailer.send(msg)
         print(f"Email sent successfully to {recipient_email} with all attachments.")
     except Exception as e:
         print(f"Failed to send email to {recipient_email}: {e}")
 
-def fetch_google_sheet(url):
-    """Fetches the Google Sheet CSV data and returns a pandas DataFrame."""
-    response = requests.get(url)
-    response.raise_for_status()
-    csv_data = StringIO(response.text)
-    return pd.read_csv(csv_data, dtype=str)
+def fetch_google_sheet(url, sheet_cache=None, since=None, metrics=None, leads_cache=None):
+    """
+    Fetches the Google Sheet and returns its normalized leads as a pandas DataFrame.
+    With a sheet_cache, returns None (without parsing) if the sheet is unchanged
+    since it was last processed. With `since`, only rows dated on or after it
+    are returned, read from the shared leads_cache when the Prep Uploader
+    already parsed this version of the sheet.
+    """
+    return fetch_leads(url, since, sheet_cache, leads_cache, metrics=metrics)
 
 def generate_sku():
     """Generates a random SKU in the format: 4 letters - (6 characters mix)."""
@@ -201,51 +169,52 @@ def generate_sku():
 
 def fetch_s3_file(bucket, key):
     """Fetches a file from S3 and returns it as a BytesIO object."""
-    s3_client = boto3.client('s3')
-    response = s3_client.get_object(Bucket=bucket, Key=key)
-    return BytesIO(response['Body'].read())
+    return BytesIO(read_bytes(bucket, key))
 
-def process_sheet(sheet_url, sb_file_key, sb_updated_file, ws, headers, col_indices, last_processed_date):
+def build_asin_index(sb_df):
     """
-    Process a Google Sheet and update its corresponding Sellerboard DataFrame.
-    Returns the sheet DataFrame, the updated SB DataFrame, and lists of updates.
+    Maps each ASIN in the Sellerboard DataFrame to the SKU and Cost of its first row,
+    so purchase rows can be matched with a dict lookup instead of a full column scan.
     """
-    df = fetch_google_sheet(sheet_url)
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    # Filter rows that are after the last processed date
-    df = df[df['Date'] >= pd.to_datetime(last_processed_date)]
-    df['Sale Price'] = df['Sale Price'].astype(str).str.replace('$', '').str.strip()
-    
-    sb_data = fetch_s3_file(CONFIG_S3_BUCKET, sb_file_key)
-    sb_df = pd.read_excel(sb_data)
-    sb_df.columns = sb_df.columns.str.strip()
-    sb_df['ASIN'] = sb_df['ASIN'].astype(str).str.strip()
-    sb_df['SKU'] = sb_df['SKU'].astype(str).str.strip()
-    df['ASIN'] = df['ASIN'].astype(str).str.strip()
-    df['COGS'] = pd.to_numeric(df['COGS'].replace(r'[\$,]', '', regex=True), errors='coerce')
-    
+    first_rows = sb_df.drop_duplicates(subset='ASIN', keep='first')
+    return {
+        asin: {'SKU': sku, 'Cost': cost}
+        for asin, sku, cost in zip(first_rows['ASIN'], first_rows['SKU'], first_rows['Cost'])
+    }
+
+def apply_purchases(df, sb_df, ws, headers, col_indices):
+    """
+    Classifies every purchase row against the Sellerboard ASIN index in one pass:
+    Replen rows are skipped, missing costs are filled, differing costs are reported
+    as potential COGS updates and unknown ASINs become new products.
+    Returns the updated SB DataFrame and lists of updates.
+    """
+    import pandas as pd
+
+    asin_index = build_asin_index(sb_df)
+    filled_costs = {}
+    new_sb_rows = []
     potential_updates = []
     new_products = []
     actual_updates = []
     
-    for _, row in df.iterrows():
-        if row['Sale Price'] == "Replen":
+    for asin, name, cogs, sale_price in zip(df['ASIN'], df['Name'], df['COGS'], df['Sale Price']):
+        if sale_price == "Replen":
             continue
 
-        asin = row['ASIN']
-        existing_entry = sb_df[sb_df['ASIN'] == asin]
-        name = row['Name']
         try:
-            new_cost = float(row['COGS'])
+            new_cost = float(cogs)
         except (ValueError, TypeError):
             continue
 
-        if not existing_entry.empty:
-            old_cost = existing_entry.iloc[0]['Cost']
-            sku = existing_entry.iloc[0]['SKU']
+        existing_entry = asin_index.get(asin)
+        if existing_entry is not None:
+            old_cost = existing_entry['Cost']
+            sku = existing_entry['SKU']
             # Treat empty, NaN, or 'nan' as missing
             if pd.isna(old_cost) or old_cost == '' or str(old_cost).lower() == 'nan':
-                sb_df.loc[sb_df['ASIN'] == asin, 'Cost'] = new_cost
+                existing_entry['Cost'] = new_cost
+                filled_costs[asin] = new_cost
                 actual_updates.append({
                     'ASIN': asin,
                     'SKU': sku,
@@ -279,101 +248,427 @@ def process_sheet(sheet_url, sb_file_key, sb_updated_file, ws, headers, col_indi
                 'VAT_CATEGORY': 'A_GEN_STANDARD',
                 'Hide': 'NO'
             }
-            sb_df = pd.concat([sb_df, pd.DataFrame([new_sb_row])], ignore_index=True)
+            new_sb_rows.append(new_sb_row)
+            asin_index[asin] = {'SKU': sku, 'Cost': new_cost}
             new_row = [None] * len(headers)
             new_row[col_indices['Your Search Term'] - 1] = asin
             new_row[col_indices['Recommended Action'] - 1] = 'Ready To list > Enter required details.'
-            new_row[col_indices["Amazon's Title"] - 1] = row['Name']
+            new_row[col_indices["Amazon's Title"] - 1] = name
             new_row[col_indices['Record Action'] - 1] = 'Add Product'
             new_row[col_indices['Seller SKU'] - 1] = sku
             new_row[col_indices['Merchant Suggested ASIN'] - 1] = asin
             new_row[col_indices['Offering Condition Type'] - 1] = 'New'
             new_row[col_indices['Fulfillment Channel Code (US)'] - 1] = 'AMAZON_NA'
-            new_row[col_indices['Your Price USD (Sell on Amazon, US)'] - 1] = f"{float(row['Sale Price']) * 1.15:.2f}"
+            new_row[col_indices['Your Price USD (Sell on Amazon, US)'] - 1] = f"{float(sale_price) * 1.15:.2f}"
             # Set column 55 ("Are batteries required?") to "No"
             new_row[54] = "No"
             # Set column 58 ("Dangerous Goods Regulations") to "Unknown"
             new_row[57] = "Unknown"
             ws.append(new_row)
     
+    # Append all new products at once instead of copying sb_df for every new ASIN
+    if new_sb_rows:
+        sb_df = pd.concat([sb_df, pd.DataFrame(new_sb_rows)], ignore_index=True)
+    
+    # Write all filled costs back in one vectorized step (every row sharing the ASIN)
+    if filled_costs:
+        fill_mask = sb_df['ASIN'].isin(filled_costs.keys())
+        sb_df.loc[fill_mask, 'Cost'] = sb_df.loc[fill_mask, 'ASIN'].map(filled_costs)
+    
+    return sb_df, potential_updates, new_products, actual_updates
+
+def refresh_listing_loader_template():
+    """
+    Makes sure the cached Listing Loader template matches the object in S3.
+    Only the ETag is checked here. When it changed (or on a cold start) the cached
+    copy is dropped and the next checkout downloads and parses the new template,
+    so runs where no user needs a workbook never load it.
+    """
+    etag = get_s3_client().head_object(Bucket=CONFIG_S3_BUCKET, Key=LISTING_LOADER_KEY)['ETag']
+    with listing_loader_lock:
+        if etag == listing_loader_cache["etag"]:
+            print("Using cached Listing Loader template.")
+            return
+        listing_loader_cache.update({
+            "etag": etag,
+            "bytes": None,
+            "headers": None,
+            "col_indices": None,
+            "template_rows": 0,
+            "workbooks": []
+        })
+
+def load_listing_loader_template():
+    """Downloads and parses the template into the cache. Called with listing_loader_lock held."""
+    from openpyxl import load_workbook
+
+    response = get_s3_client().get_object(Bucket=CONFIG_S3_BUCKET, Key=LISTING_LOADER_KEY)
+    template_bytes = response['Body'].read()
+    wb = load_workbook(filename=BytesIO(template_bytes), keep_vba=True)
+    ws = wb["Template"]
+    headers = [cell.value for cell in ws[4]]
+
+    def get_column_index(col_name):
+        return headers.index(col_name) + 1 if col_name in headers else None
+
+    listing_loader_cache.update({
+        "etag": response.get('ETag', listing_loader_cache["etag"]),
+        "bytes": template_bytes,
+        "headers": headers,
+        "col_indices": {col: get_column_index(col) for col in LISTING_LOADER_COLUMNS},
+        "template_rows": ws.max_row,
+        "workbooks": [wb]
+    })
+    print("Loaded Listing Loader template from S3.")
+
+def checkout_listing_loader():
+    """
+    Returns a clean Listing Loader workbook with the template's headers and column
+    indices. The template is loaded on the first checkout after a refresh; further
+    copies are parsed from the cached bytes only if no pooled workbook is free.
+    """
+    with listing_loader_lock:
+        if listing_loader_cache["bytes"] is None:
+            load_listing_loader_template()
+        wb = listing_loader_cache["workbooks"].pop() if listing_loader_cache["workbooks"] else None
+        template_bytes = listing_loader_cache["bytes"]
+        headers = listing_loader_cache["headers"]
+        col_indices = listing_loader_cache["col_indices"]
+    if wb is None:
+        from openpyxl import load_workbook
+
+        wb = load_workbook(filename=BytesIO(template_bytes), keep_vba=True)
+    return wb, headers, col_indices
+
+def release_listing_loader(wb):
+    """Removes the rows appended for a user and returns the workbook to the cache."""
+    ws = wb["Template"]
+    template_rows = listing_loader_cache["template_rows"]
+    if ws.max_row > template_rows:
+        ws.delete_rows(template_rows + 1, ws.max_row - template_rows)
+    listing_loader_cache["workbooks"].append(wb)
+
+def normalize_catalog(sb_df):
+    """Strips the catalog's column names and makes ASIN and SKU stripped text, in place."""
+    sb_df.columns = sb_df.columns.str.strip()
+    sb_df['ASIN'] = sb_df['ASIN'].astype(str).str.strip()
+    sb_df['SKU'] = sb_df['SKU'].astype(str).str.strip()
+    return sb_df
+
+def catalog_hash(sb_df):
+    """
+    Content hash of a Sellerboard catalog (column names and every value). Hash
+    catalogs after normalize_catalog(), so a reload compares equal to a processed copy.
+    """
+    import pandas as pd
+
+    digest = hashlib.sha256("\x1f".join(map(str, sb_df.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(sb_df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def changed_catalog_rows(sb_df, new_products, actual_updates):
+    """The catalog rows added or given a cost in this run (every row of a filled ASIN)."""
+    changed_asins = {product['ASIN'] for product in new_products} | {update['ASIN'] for update in actual_updates}
+    return sb_df[sb_df['ASIN'].isin(changed_asins)]
+
+def delta_filename(sb_updated_file):
+    """Attachment name of the changed-rows import file, e.g. tevin_sb_changes.xlsx."""
+    stem, extension = os.path.splitext(sb_updated_file)
+    return f"{stem}_changes{extension}"
+
+def snapshot_key(sb_file_key):
+    """S3 key of the Parquet snapshot kept next to a Sellerboard xlsx."""
+    return os.path.splitext(sb_file_key)[0] + ".parquet"
+
+def load_sellerboard(sb_file_key):
+    """
+    Loads a user's Sellerboard catalog. The Parquet snapshot is the working copy
+    and is used whenever it was derived from the xlsx currently in S3 (its
+    "source-etag" metadata matches the xlsx ETag). If the xlsx was replaced, e.g.
+    by a fresh Sellerboard export uploaded through the bot, the xlsx is read instead.
+    Returns the DataFrame and the xlsx ETag.
+    """
+    import pandas as pd
+
+    xlsx_etag = get_etag(CONFIG_S3_BUCKET, sb_file_key)
+    if SB_SNAPSHOTS_ENABLED and xlsx_etag is not None:
+        try:
+            response = get_s3_client().get_object(Bucket=CONFIG_S3_BUCKET, Key=snapshot_key(sb_file_key))
+            if response.get('Metadata', {}).get('source-etag') == xlsx_etag:
+                return pd.read_parquet(BytesIO(response['Body'].read())), xlsx_etag
+            print(f"Snapshot for {sb_file_key} is out of date; reading the xlsx.")
+        except Exception as e:
+            print(f"No usable snapshot for {sb_file_key} ({e}); reading the xlsx.")
+    return pd.read_excel(fetch_s3_file(CONFIG_S3_BUCKET, sb_file_key)), xlsx_etag
+
+def save_sellerboard_snapshot(sb_file_key, sb_df, xlsx_etag):
+    """
+    Writes the Parquet working copy, tagged with the ETag of the xlsx it is based on.
+    Returns False if the snapshot could not be written.
+    """
+    if not SB_SNAPSHOTS_ENABLED or xlsx_etag is None:
+        return False
+    try:
+        snapshot_buffer = BytesIO()
+        sb_df.to_parquet(snapshot_buffer, index=False)
+        write_bytes(
+            CONFIG_S3_BUCKET,
+            snapshot_key(sb_file_key),
+            snapshot_buffer.getvalue(),
+            metadata={'source-etag': xlsx_etag}
+        )
+        return True
+    except Exception as e:
+        print(f"Error saving snapshot for {sb_file_key}: {e}")
+        return False
+
+def sellerboard_to_xlsx(sb_df):
+    """
+    Serializes the Sellerboard catalog to an xlsx buffer. The default write-only
+    mode streams rows straight into the sheet XML instead of building openpyxl's
+    full cell model, which keeps time and memory flat for large catalogs.
+    """
+    from openpyxl import Workbook
+
+    sb_buffer = io.BytesIO()
+    if SB_XLSX_WRITER == "pandas":
+        sb_df.to_excel(sb_buffer, index=False, engine='openpyxl')
+    else:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        ws.append(list(sb_df.columns))
+        # Empty cells instead of NaN, matching to_excel
+        values = sb_df.astype(object).where(sb_df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+        wb.save(sb_buffer)
+    sb_buffer.seek(0)
+    return sb_buffer
+
+def write_sellerboard_xlsx(sb_file_key, sb_df, metrics=None):
+    """Writes the Sellerboard catalog as xlsx to S3. Returns the buffer and the new ETag."""
+    metrics = metrics or StageMetrics()
+    with metrics.stage("xlsx_save"):
+        sb_buffer = sellerboard_to_xlsx(sb_df)
+    metrics.count("sellerboard_xlsx_bytes", len(sb_buffer.getbuffer()))
+    with metrics.stage("s3_upload"):
+        xlsx_etag = write_bytes(CONFIG_S3_BUCKET, sb_file_key, sb_buffer.getvalue())
+    return sb_buffer, xlsx_etag
+
+def process_sheet(df, sb_df, ws, headers, col_indices, last_processed_date):
+    """
+    Process a fetched Google Sheet and update the user's Sellerboard DataFrame.
+    The sheet comes from fetch_google_sheet, so Date, COGS and Sale Price are
+    already normalized. Returns the sheet DataFrame, the updated SB DataFrame,
+    and lists of updates.
+    """
+    import pandas as pd
+
+    # Filter rows that are after the last processed date
+    df = df[df['Date'] >= pd.to_datetime(last_processed_date)]
+    
+    normalize_catalog(sb_df)
+    df['ASIN'] = df['ASIN'].astype(str).str.strip()
+    
+    sb_df, potential_updates, new_products, actual_updates = apply_purchases(
+        df, sb_df, ws, headers, col_indices
+    )
+    
     return df, sb_df, potential_updates, new_products, actual_updates
 
+def process_user(user, last_processed_date, sheet_cache=None, metrics=None, leads_cache=None):
+    """
+    Runs the full pipeline for one user: sheet and SB fetch, Listing Loader build,
+    S3 upload and email. Returns the latest purchase date processed, or None.
+    Users whose sheet is unchanged since it was last processed are skipped.
+    Stage timings and row/byte counts are recorded in `metrics`.
+    """
+    from common.row_index import RowIndex, row_index_key
+
+    metrics = metrics or StageMetrics()
+    sheet_df = fetch_google_sheet(
+        user["sheet_url"], sheet_cache, since=last_processed_date, metrics=metrics, leads_cache=leads_cache
+    )
+    if sheet_df is None:
+        print(f"{user['name']}'s sheet is unchanged since the last run; skipping.")
+        return None
+    
+    # Only rows not handled by an earlier run are processed, so reruns are no-ops
+    with metrics.stage("s3_row_index"):
+        row_index = RowIndex(CONFIG_S3_BUCKET, row_index_key("sb", user["name"]))
+    sheet_df = sheet_df[row_index.new_rows_mask(sheet_df)].copy()
+    metrics.count("new_rows", len(sheet_df))
+    if sheet_df.empty:
+        print(f"No new purchases for {user['name']}; skipping.")
+        if sheet_cache is not None:
+            sheet_cache.mark_processed(user["sheet_url"])
+        return None
+    
+    # Check out a clean copy of the cached Listing Loader workbook for this user
+    with metrics.stage("workbook_build"):
+        wb, headers, col_indices = checkout_listing_loader()
+    ws = wb["Template"]
+    
+    # Process the user's Google Sheet against their Sellerboard catalog
+    with metrics.stage("sellerboard_load"):
+        sb_df, xlsx_etag = load_sellerboard(user["sb_file_key"])
+    with metrics.stage("catalog_hash"):
+        # Hashed in the form process_sheet leaves it, so an untouched catalog compares equal
+        loaded_catalog_hash = catalog_hash(normalize_catalog(sb_df))
+    metrics.count("sellerboard_rows", len(sb_df))
+    with metrics.stage("convert"):
+        df, sb_df, potential_updates, new_products, actual_updates = process_sheet(
+            sheet_df,
+            sb_df,
+            ws,
+            headers,
+            col_indices,
+            last_processed_date
+        )
+    metrics.count("new_products", len(new_products))
+    metrics.count("cost_updates", len(actual_updates))
+    metrics.count("potential_updates", len(potential_updates))
+    
+    # Save the updated Listing Loader workbook to a buffer for this user
+    with metrics.stage("xlsx_save"):
+        listing_loader_buffer = io.BytesIO()
+        wb.save(listing_loader_buffer)
+    metrics.count("listing_loader_bytes", len(listing_loader_buffer.getvalue()))
+    with metrics.stage("workbook_build"):
+        release_listing_loader(wb)
+    
+    # The catalog is only written back to S3 when its content changed. The xlsx
+    # is only generated when the full catalog gets emailed; otherwise the Parquet
+    # snapshot alone carries this run's changes (and the xlsx stays its source).
+    email_full_catalog = bool(user["email"]) and SB_EXPORT_MODE == "full"
+    with metrics.stage("catalog_hash"):
+        catalog_changed = catalog_hash(sb_df) != loaded_catalog_hash
+    sb_buffer = None
+    if not catalog_changed:
+        print(f"{user['name']}'s Sellerboard catalog is unchanged; skipping the S3 write.")
+        metrics.count("catalog_writes_skipped", 1)
+        if email_full_catalog:
+            with metrics.stage("xlsx_save"):
+                sb_buffer = sellerboard_to_xlsx(sb_df)
+    else:
+        if email_full_catalog:
+            sb_buffer, xlsx_etag = write_sellerboard_xlsx(user["sb_file_key"], sb_df, metrics)
+            print(f"Successfully uploaded updated {user['name']} SB file to S3")
+        with metrics.stage("s3_upload"):
+            snapshot_saved = save_sellerboard_snapshot(user["sb_file_key"], sb_df, xlsx_etag)
+        if not snapshot_saved and sb_buffer is None:
+            # Without a fresh snapshot the xlsx must carry the changes
+            write_sellerboard_xlsx(user["sb_file_key"], sb_df, metrics)
+            print(f"Successfully uploaded updated {user['name']} SB file to S3")
+    
+    if user["email"]:
+        # Each user gets their own Listing Loader workbook
+        attachments = [(listing_loader_buffer, "listingLoaderUpdated.xlsm")]
+        if email_full_catalog:
+            attachments.append((sb_buffer, user["sb_updated_file"]))
+        else:
+            # Only the rows changed in this run, as a small Sellerboard import file
+            delta_df = changed_catalog_rows(sb_df, new_products, actual_updates)
+            metrics.count("delta_rows", len(delta_df))
+            if not delta_df.empty:
+                with metrics.stage("xlsx_save"):
+                    delta_buffer = sellerboard_to_xlsx(delta_df)
+                attachments.append((delta_buffer, delta_filename(user["sb_updated_file"])))
+        send_email(
+            attachments,
+            user["email"],
+            potential_updates,
+            new_products,
+            actual_updates,
+            metrics
+        )
+    
+    with metrics.stage("s3_row_index"):
+        row_index.add(sheet_df)
+        row_index.save(prune_before=last_processed_date)
+    if sheet_cache is not None:
+        sheet_cache.mark_processed(user["sheet_url"])
+    
+    return None if df.empty else df["Date"].max()
+
 def lambda_handler(event, context):
     """AWS Lambda entry point."""
+    mailer.reset()
+    invocation_metrics = StageMetrics("sb")
+    record_cold_start(invocation_metrics)
+    user_metrics = {}
+
+    def metrics_summary():
+        """Emits every pipeline's metrics and returns them for the response body."""
+        for metrics in [invocation_metrics, *user_metrics.values()]:
+            metrics.emit()
+        return {
+            "invocation": invocation_metrics.summary(),
+            "users": {name: metrics.summary() for name, metrics in user_metrics.items()}
+        }
+
     try:
-        last_processed_date = get_last_processed_date()
+        validate_users_config()
+        # Read the shared watermark once and hand it to every user pipeline
+        with invocation_metrics.stage("s3_config_read"):
+            last_processed_date = get_last_processed_date()
+        with invocation_metrics.stage("template_refresh"):
+            refresh_listing_loader_template()
+        sheet_cache = get_sheet_cache(CONFIG_S3_BUCKET, "sb")
+        leads_cache = get_leads_cache(CONFIG_S3_BUCKET, "sb")
+        
+        # Run each user's pipeline in its own worker so a slow or failing user
+        # doesn't hold up (or abort) everyone else.
+        active_users = [user for user in users_config if user["sheet_url"]]
+        user_metrics = {user["name"]: StageMetrics("sb", user=user["name"]) for user in active_users}
         new_date_list = []
-        s3_client = boto3.client('s3')
+        failed_users = {}
+        with ThreadPoolExecutor(max_workers=max(1, USER_CONCURRENCY)) as executor:
+            futures = {
+                executor.submit(
+                    process_user, user, last_processed_date, sheet_cache, user_metrics[user["name"]], leads_cache
+                ): user
+                for user in active_users
+            }
+            for future in as_completed(futures):
+                user = futures[future]
+                try:
+                    latest_date = future.result()
+                except Exception as e:
+                    print(f"Error processing {user['name']}: {e}")
+                    failed_users[user['name']] = str(e)
+                    continue
+                if latest_date is not None:
+                    new_date_list.append(latest_date)
+        with invocation_metrics.stage("sheet_cache_save"):
+            sheet_cache.save()
         
-        # Process each user separately so each gets a unique Listing Loader; here, only Tevin.
-        for user in users_config:
-            if not user["sheet_url"]:
-                continue
-            
-            # Load a fresh copy of the Listing Loader workbook for this user
-            listing_loader_data = fetch_s3_file(CONFIG_S3_BUCKET, LISTING_LOADER_KEY)
-            wb = load_workbook(filename=listing_loader_data, keep_vba=True)
-            ws = wb["Template"]
-            headers = [cell.value for cell in ws[4]]
-            
-            def get_column_index(col_name):
-                return headers.index(col_name) + 1 if col_name in headers else None
-            
-            col_indices = {col: get_column_index(col) for col in [
-                'Your Search Term', "Amazon's Title", 'Record Action', 'Seller SKU', 
-                'Merchant Suggested ASIN', 'Offering Condition Type', 'Fulfillment Channel Code (US)',
-                'Your Price USD (Sell on Amazon, US)', 'Recommended Action'
-            ]}
-            
-            # Process the user's Google Sheet
-            df, sb_df, potential_updates, new_products, actual_updates = process_sheet(
-                user["sheet_url"],
-                user["sb_file_key"],
-                user["sb_updated_file"],
-                ws,
-                headers,
-                col_indices,
-                last_processed_date
-            )
-            if not df.empty:
-                new_date_list.append(df["Date"].max())
-            
-            # Save the updated Listing Loader workbook to a buffer for this user
-            listing_loader_output_buffer = io.BytesIO()
-            wb.save(listing_loader_output_buffer)
-            listing_loader_output_buffer.seek(0)
-            listing_loader_bytes = listing_loader_output_buffer.getvalue()
-            
-            # Upload updated Sellerboard file for this user to S3
-            sb_buffer = io.BytesIO()
-            sb_df.to_excel(sb_buffer, index=False, engine='openpyxl')
-            sb_buffer.seek(0)
-            s3_client.put_object(Bucket=CONFIG_S3_BUCKET, Key=user["sb_file_key"], Body=sb_buffer.getvalue())
-            print(f"Successfully uploaded updated {user['name']} SB file to S3")
-            
-            # Prepare attachments for this user: each gets their own Listing Loader workbook
-            attachments = [
-                (BytesIO(listing_loader_bytes), "listingLoaderUpdated.xlsm"),
-                (sb_buffer, user["sb_updated_file"])
-            ]
-            
-            if user["email"]:
-                send_email(
-                    attachments,
-                    user["email"],
-                    potential_updates,
-                    new_products,
-                    actual_updates
-                )
+        # Only advance the watermark when every user succeeded, so a failed
+        # user's purchases are picked up again on the next run.
+        if failed_users:
+            print(f"Not updating last processed date; failed users: {', '.join(failed_users)}")
+            return {
+                'statusCode': 500,
+                'body': json.dumps({
+                    'message': 'Some users failed to process.',
+                    'failed_users': failed_users,
+                    'metrics': metrics_summary()
+                })
+            }
         
         # Update the last processed date using the maximum date from all users
         if new_date_list:
-            new_last_processed_date = str(pd.to_datetime(max(new_date_list)).date())
-            update_last_processed_date(new_last_processed_date)
+            new_last_processed_date = str(max(new_date_list).date())
+            with invocation_metrics.stage("s3_config_write"):
+                update_last_processed_date(new_last_processed_date)
         
         return {
             'statusCode': 200,
-            'body': json.dumps('Process completed successfully!')
+            'body': json.dumps({
+                'message': 'Process completed successfully!',
+                'emails': mailer.results,
+                'metrics': metrics_summary()
+            })
         }
     
     except Exception as e:
@@ -381,4 +676,7 @@ def lambda_handler(event, context):
         return {
             'statusCode': 500,
             'body': json.dumps(f"Error: {str(e)}")
-        }
\ No newline at end of file
+        }
+    
+    finally:
+        mailer.close()
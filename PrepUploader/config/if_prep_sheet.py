@@ -0,0 +1,99 @@
+"""
+Column-wise conversion of a leads sheet into the Instant Fulfillment prep
+sheet layout. Shared by prep_upload_v1.py and lambda_function.py.
+"""
+import pandas as pd
+
+from common.leads_csv import COGS_TEXT_COLUMN
+
+REQUIRED_HEADERS = [
+    "Order Date", "Supplier / Retailer", "Item Name / Description",
+    "Size / Color", "Bundled?", "# Units in Bundle", "# Units Expected",
+    "ASIN", "COGS", "Requested List Price", "Seller Notes / Prep Request",
+    "Tracking #", "Custom MSKU", "Order #", "UPC #", "FBA or FBM"
+]
+
+# Markup applied to the sale price for the requested list price
+LIST_PRICE_MARKUP = 1.15
+
+
+def text_column(leads_df, column, default):
+    """Returns str() of every value in a column, or the default if the column is missing."""
+    if column not in leads_df.columns:
+        return pd.Series(str(default), index=leads_df.index, dtype=object)
+    return leads_df[column].astype(object).map(str)
+
+
+def cogs_column(leads_df):
+    """
+    COGS exactly as written in the sheet. Normalized sheets
+    (common.leads_csv.normalize_leads) keep that text in COGS_TEXT_COLUMN.
+    """
+    if COGS_TEXT_COLUMN in leads_df.columns:
+        return text_column(leads_df, COGS_TEXT_COLUMN, "")
+    return text_column(leads_df, "COGS", "")
+
+
+def requested_list_price(sale_price_str):
+    """Applies the list price markup to a cleaned sale price; non-numeric prices become ""."""
+    try:
+        return str(round(float(sale_price_str) * LIST_PRICE_MARKUP, 2))
+    except ValueError:
+        return ""
+
+
+def convert_leads(leads_df):
+    """
+    Maps the leads rows to REQUIRED_HEADERS and returns an all-string DataFrame
+    ready to be written with csv.QUOTE_ALL.
+    """
+    index = leads_df.index
+
+    sale_price_str = (
+        text_column(leads_df, "Sale Price", "0")
+        .str.replace("$", "", regex=False)
+        .str.replace(",", "", regex=False)
+        .str.strip()
+    )
+    # Prices repeat a lot across purchases, so each distinct value is parsed once
+    price_lookup = {price: requested_list_price(price) for price in sale_price_str.unique()}
+    requested_price = sale_price_str.map(price_lookup)
+    is_replen = sale_price_str.str.upper().str.contains("REPLEN", regex=False)
+    requested_price = requested_price.where(~is_replen, "Replen")
+
+    if "Bundled?" in leads_df.columns:
+        bundled = leads_df["Bundled?"].astype(object)
+        has_bundle = bundled.notna()
+        bundled_str = bundled.map(str)
+        bundled_flag = (has_bundle & (bundled_str.str.strip() != "")).map({True: "Yes", False: "No"})
+        units_in_bundle = bundled_str.where(has_bundle, "")
+    else:
+        bundled_flag = pd.Series("No", index=index, dtype=object)
+        units_in_bundle = pd.Series("", index=index, dtype=object)
+
+    if "Prep Notes" in leads_df.columns:
+        prep_notes = leads_df["Prep Notes"].astype(object)
+        prep_notes = prep_notes.where(prep_notes.notna(), "")
+    else:
+        prep_notes = pd.Series("", index=index, dtype=object)
+
+    output_df = pd.DataFrame({
+        "Order Date": leads_df["Date"].dt.strftime("%Y-%m-%d").astype(object).where(leads_df["Date"].notna(), ""),
+        "Supplier / Retailer": "N/A",
+        "Item Name / Description": text_column(leads_df, "Name", ""),
+        "Size / Color": text_column(leads_df, "Size/Color", "N/A"),
+        "Bundled?": bundled_flag,
+        "# Units in Bundle": units_in_bundle,
+        "# Units Expected": text_column(leads_df, "Amount Purchased", ""),
+        "ASIN": text_column(leads_df, "ASIN", ""),
+        "COGS": cogs_column(leads_df),
+        "Requested List Price": requested_price,
+        "Seller Notes / Prep Request": prep_notes,
+        "Tracking #": "",
+        "Custom MSKU": "",
+        "Order #": text_column(leads_df, "Order #", ""),
+        "UPC #": "",
+        "FBA or FBM": "FBA"
+    }, index=index)
+    output_df = output_df.reset_index(drop=True)
+    return output_df.reindex(columns=REQUIRED_HEADERS, fill_value="").astype(str)
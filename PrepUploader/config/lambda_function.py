@@ -1,28 +1,50 @@
 import json
 import os
 import sys
-import pandas as pd
 import requests
-import smtplib
-import ssl
 from email.message import EmailMessage
-from dotenv import load_dotenv
-import boto3
-from io import StringIO
+from io import BytesIO, StringIO
 import csv
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-# Load environment variables
-load_dotenv()
+# Make the repo-level common/ package importable when run from this folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+# Imported first so the cold start timer covers the rest of init
+from common.runtime import load_local_env, record_cold_start
+from common.attachments import add_attachments, links_text, prepare_attachments
+from common.leads_cache import fetch_leads, get_leads_cache
+from common.mailer import Mailer
+from common.metrics import StageMetrics
+from common.sheet_cache import get_sheet_cache
+from common.storage import read_json, write_json
+
+# pandas and the modules built on it (if_prep_sheet, common.leads_csv,
+# common.row_index) are imported inside the functions that use them, so cold
+# starts and runs where no sheet changed never load them.
+
+# Load environment variables (local runs only; Lambda uses the function's environment)
+load_local_env()
 
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 CONFIG_S3_BUCKET = os.getenv("CONFIG_S3_BUCKET")
 
+# One SMTP connection per invocation, reused for every email (closed by the handler)
+mailer = Mailer(EMAIL_ADDRESS, EMAIL_PASSWORD)
+
 # Key for your new user config file in S3
 USERS_CONFIG_KEY = "users.json"
 
+# Maximum number of Google Sheets downloaded at the same time
+SHEET_FETCH_CONCURRENCY = int(os.getenv("SHEET_FETCH_CONCURRENCY", "8"))
+# Seconds allowed for connecting to / waiting on Google before a fetch is abandoned
+SHEET_FETCH_TIMEOUT = float(os.getenv("SHEET_FETCH_TIMEOUT", "30"))
+# Wall-clock seconds for the whole batch of fetches; sheets still downloading are reported as failed
+SHEET_FETCH_DEADLINE = float(os.getenv("SHEET_FETCH_DEADLINE", "60"))
+
 # Define a Tee class to duplicate stdout writes to multiple streams
 class Tee:
     def __init__(self, *streams):
@@ -38,11 +60,9 @@ class Tee:
 
 def get_last_processed_date():
     """Retrieve the last processed date from the config file in S3."""
-    s3_client = boto3.client('s3')
     config_key = "config.json"
     try:
-        response = s3_client.get_object(Bucket=CONFIG_S3_BUCKET, Key=config_key)
-        config_data = json.loads(response['Body'].read().decode('utf-8'))
+        config_data = read_json(CONFIG_S3_BUCKET, config_key)
         return config_data.get("last_processed_date", "2000-01-01")
     except Exception as e:
         print(f"Error fetching last processed date: {e}")
@@ -50,11 +70,9 @@ def get_last_processed_date():
 
 def update_last_processed_date(new_date):
     """Update the last processed date in the config file stored in S3."""
-    s3_client = boto3.client('s3')
     config_key = "config.json"
-    new_config = json.dumps({"last_processed_date": new_date})
     try:
-        s3_client.put_object(Bucket=CONFIG_S3_BUCKET, Key=config_key, Body=new_config)
+        write_json(CONFIG_S3_BUCKET, config_key, {"last_processed_date": new_date})
         print(f"Updated last processed date to: {new_date} in S3.")
     except Exception as e:
         print(f"Error updating last_processed_date: {e}")
@@ -68,75 +86,82 @@ def send_error_email(error_message):
     msg.set_content(f"An error occurred while running the script:\n\n{error_message}")
     
     try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
+        mailer.send(msg)
         print("Error email sent successfully.")
     except Exception as e:
         print(f"Failed to send error email: {e}")
 
-def send_email(attachment_data, attachment_filename, recipient_email):
-    """Sends an email with the processed IF Prep Sheet attached."""
+def send_email(attachment_data, attachment_filename, recipient_email, metrics=None):
+    """
+    Sends an email with the processed IF Prep Sheet attached (zipped if large,
+    or as an S3 download link if too large for the email; see common.attachments).
+    """
+    metrics = metrics or StageMetrics()
     msg = EmailMessage()
     msg['From'] = EMAIL_ADDRESS
     msg['To'] = recipient_email
     msg['Subject'] = "Processed Instant Fulfillment Sheet"
-    msg.set_content("Attached is the updated IF Prep Sheet.")
 
     try:
-        msg.add_attachment(
-            attachment_data.encode("utf-8"),
-            maintype="text",
-            subtype="csv",
-            filename=attachment_filename
-        )
+        files, links = prepare_attachments([(attachment_data, attachment_filename)], CONFIG_S3_BUCKET, metrics)
+        if not files and not links:
+            # The prep sheet is the whole email
+            raise ValueError(f"{attachment_filename} could not be attached or uploaded")
+        msg.set_content("Attached is the updated IF Prep Sheet." + links_text(links))
+        add_attachments(msg, files)
     except Exception as e:
         print(f"Failed to add attachment: {e}")
         return
 
     try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
+        with metrics.stage("smtp_send"):
+            mailer.send(msg)
         print("Email sent successfully.")
     except Exception as e:
         print(f"Failed to send email: {e}")
 
-def send_notification_email(recipient_email, subject, message):
+def send_notification_email(recipient_email, subject, message, metrics=None):
     """Sends a notification email to the user."""
+    metrics = metrics or StageMetrics()
     msg = EmailMessage()
     msg['From'] = EMAIL_ADDRESS
     msg['To'] = recipient_email
     msg['Subject'] = subject
     msg.set_content(message)
     try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
+        with metrics.stage("smtp_send"):
+            mailer.send(msg)
         print(f"Notification email sent to {recipient_email}.")
     except Exception as e:
         print(f"Failed to send notification email to {recipient_email}: {e}")
 
-def fetch_google_sheet(url):
-    """Fetches the Google Sheet CSV data and returns a pandas DataFrame."""
+def fetch_google_sheet(
+    url, timeout=SHEET_FETCH_TIMEOUT, sheet_cache=None, since=None, metrics=None, leads_cache=None, deadline=None
+):
+    """
+    Fetches the Google Sheet and returns its normalized leads as a pandas DataFrame.
+    With a sheet_cache, returns None (without parsing) if the sheet is unchanged
+    since it was last processed. With `since`, only rows dated on or after it
+    are returned, read from the shared leads_cache when the Sellerboard updater
+    already parsed this version of the sheet. Past the `deadline` (a
+    time.monotonic() value) the fetch is abandoned without touching either cache.
+    """
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        csv_data = StringIO(response.text)
-        df = pd.read_csv(csv_data, dtype=str)
-        print("Google Sheet data fetched successfully.")
-        return df
+        df = fetch_leads(url, since, sheet_cache, leads_cache, timeout=timeout, metrics=metrics, deadline=deadline)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching Google Sheet: {e}")
         raise
-    except pd.errors.ParserError as e:
+    except ValueError as e:
+        # pandas' ParserError is a ValueError
         print(f"Error parsing CSV data: {e}")
         raise
+    if df is None:
+        print("Google Sheet unchanged since the last processed version.")
+        return None
+    print("Google Sheet data fetched successfully.")
+    return df
 
-def start_conversion(leads_df, recipient_email):
+def start_conversion(leads_df, recipient_email, last_processed_date, metrics=None):
     """
     Converts the leads sheet to match the Instant Fulfillment template,
     filtering by last processed date and sending the result via email.
@@ -146,12 +171,13 @@ def start_conversion(leads_df, recipient_email):
                 if new data was processed, or
         None -- if no new data exists or if an error occurs
     """
+    import pandas as pd
+    from if_prep_sheet import convert_leads
+
+    metrics = metrics or StageMetrics()
     print("Starting conversion...")
 
     try:
-        last_processed_date = get_last_processed_date()
-        leads_df["Date"] = pd.to_datetime(leads_df["Date"], errors="coerce")
-        
         # Filter rows based on the last processed date
         mask = leads_df["Date"] >= pd.to_datetime(last_processed_date)
         filtered_dates = leads_df.loc[mask, "Date"]
@@ -161,64 +187,23 @@ def start_conversion(leads_df, recipient_email):
             send_notification_email(
                 recipient_email,
                 "No new purchases to process",
-                "There are no new purchases to process."
+                "There are no new purchases to process.",
+                metrics
             )
             return None
 
         earliest_date = filtered_dates.min()
         leads_df = leads_df[leads_df["Date"] >= earliest_date]
 
-        REQUIRED_HEADERS = [
-            "Order Date", "Supplier / Retailer", "Item Name / Description",
-            "Size / Color", "Bundled?", "# Units in Bundle", "# Units Expected",
-            "ASIN", "COGS", "Requested List Price", "Seller Notes / Prep Request",
-            "Tracking #", "Custom MSKU", "Order #", "UPC #", "FBA or FBM"
-        ]
-
-        output_data = []
-
-        for _, row in leads_df.iterrows():
-            date_value = row.get("Date", "")
-            date_str = "" if pd.isnull(date_value) else date_value.strftime("%Y-%m-%d")
-
-            sale_price_str = str(row.get("Sale Price", "0")).replace("$", "").replace(",", "").strip()
-            try:
-                sale_price = float(sale_price_str)
-                requested_price = round(sale_price * 1.15, 2)
-            except ValueError:
-                requested_price = ""
-
-            prep_notes = row.get("Prep Notes", "")
-            if pd.isna(prep_notes):
-                prep_notes = ""
-
-            mapped_row = {
-                "Order Date": date_str,
-                "Supplier / Retailer": "N/A",
-                "Item Name / Description": str(row.get("Name", "")),
-                "Size / Color": str(row.get("Size/Color", "N/A")),
-                "Bundled?": "Yes" if pd.notna(row.get("Bundled?")) and str(row.get("Bundled?")).strip() != "" else "No",
-                "# Units in Bundle": str(row.get("Bundled?", "")) if pd.notna(row.get("Bundled?")) else "",
-                "# Units Expected": str(row.get("Amount Purchased", "")),
-                "ASIN": str(row.get("ASIN", "")),
-                "COGS": str(row.get("COGS", "")),
-                "Requested List Price": "Replen" if "REPLEN" in sale_price_str.upper() else str(requested_price),
-                "Seller Notes / Prep Request": prep_notes,
-                "Tracking #": "",
-                "Custom MSKU": "",
-                "Order #": str(row.get("Order #", "")),
-                "UPC #": "",
-                "FBA or FBM": "FBA"
-            }
-            output_data.append(mapped_row)
-
-        output_df = pd.DataFrame(output_data)
-        output_df = output_df.reindex(columns=REQUIRED_HEADERS, fill_value="")
-        output_df = output_df.astype(str)
-
-        csv_buffer = StringIO()
-        output_df.to_csv(csv_buffer, index=False, header=True, quoting=csv.QUOTE_ALL)
-        send_email(csv_buffer.getvalue(), "IF_Prep_Sheet.csv", recipient_email)
+        with metrics.stage("convert"):
+            output_df = convert_leads(leads_df)
+        metrics.count("rows_converted", len(output_df))
+
+        # Written as UTF-8 bytes straight away so the attachment needs no extra copies
+        with metrics.stage("csv_write"):
+            csv_buffer = BytesIO()
+            output_df.to_csv(csv_buffer, index=False, header=True, quoting=csv.QUOTE_ALL, encoding="utf-8")
+        send_email(csv_buffer, "IF_Prep_Sheet.csv", recipient_email, metrics)
 
         latest_date = str(leads_df["Date"].max().date())
         print("Conversion process complete.")
@@ -230,48 +215,159 @@ def start_conversion(leads_df, recipient_email):
 
 def get_users_config():
     """Fetches the user configuration (sheet links and emails) from S3."""
-    s3_client = boto3.client('s3')
     try:
-        response = s3_client.get_object(Bucket=CONFIG_S3_BUCKET, Key=USERS_CONFIG_KEY)
-        config_data = json.loads(response['Body'].read().decode('utf-8'))
+        config_data = read_json(CONFIG_S3_BUCKET, USERS_CONFIG_KEY)
         return config_data.get("users", [])
     except Exception as e:
         print(f"Error fetching users config: {e}")
         return []
 
+def fetch_user_sheets(users, sheet_cache=None, since=None, user_metrics=None, leads_cache=None):
+    """
+    Downloads every user's sheet concurrently (capped at SHEET_FETCH_CONCURRENCY).
+    Returns one result dict per user, in the same order, holding the DataFrame
+    (None if the sheet is unchanged) or the error along with how long the fetch took.
+    Fetches that have not finished after SHEET_FETCH_DEADLINE seconds are
+    abandoned and returned as errors, so one slow sheet can't stall the run;
+    they stop at the same deadline without writing to the caches.
+    `user_metrics`, if given, holds one StageMetrics per user in the same order.
+    """
+    def fetch(user, metrics):
+        result = {"email": user.get("email")}
+        start = time.perf_counter()
+        try:
+            result["leads_df"] = fetch_google_sheet(
+                user.get("sheet"), sheet_cache=sheet_cache, since=since, metrics=metrics,
+                leads_cache=leads_cache, deadline=deadline
+            )
+        except Exception as e:
+            result["error"] = str(e)
+        result["fetch_seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    if user_metrics is None:
+        user_metrics = [StageMetrics() for _ in users]
+    deadline = time.monotonic() + SHEET_FETCH_DEADLINE
+    executor = ThreadPoolExecutor(max_workers=max(1, SHEET_FETCH_CONCURRENCY))
+    futures = [executor.submit(fetch, user, metrics) for user, metrics in zip(users, user_metrics)]
+    wait(futures, timeout=max(0, deadline - time.monotonic()))
+    # Don't wait for stalled downloads; fetches that haven't started yet are cancelled
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for user, metrics, future in zip(users, user_metrics, futures):
+        if future.done() and not future.cancelled():
+            results.append(future.result())
+            continue
+        metrics.count("sheet_fetch_timeouts", 1)
+        results.append({
+            "email": user.get("email"),
+            "error": f"Sheet fetch did not finish within {SHEET_FETCH_DEADLINE:g} seconds",
+            "fetch_seconds": SHEET_FETCH_DEADLINE
+        })
+    return results
+
 def lambda_handler(event, context):
     """AWS Lambda Entry Point."""
     # Set up log capturing by overriding sys.stdout
     original_stdout = sys.stdout
     log_buffer = StringIO()
     sys.stdout = Tee(original_stdout, log_buffer)
+    mailer.reset()
+    invocation_metrics = StageMetrics("prep")
+    record_cold_start(invocation_metrics)
 
     try:
-        # 1) Fetch all user records
-        users = get_users_config()
+        # 1) Fetch all user records and the watermark shared by every user
+        with invocation_metrics.stage("s3_config_read"):
+            users = get_users_config()
+            last_processed_date = get_last_processed_date()
         if not users:
             print("No user configurations found.")
         
-        # 2) Loop over each user record
+        # 2) Skip any record missing sheet or email
+        valid_users = []
         for user in users:
-            sheet_link = user.get("sheet")
-            recipient_email = user.get("email")
-
-            # 3) Skip any record missing sheet or email
-            if not sheet_link or not recipient_email:
+            if not user.get("sheet") or not user.get("email"):
                 print(f"Skipping user record due to missing sheet or email: {user}")
                 continue
-
-            print(f"Processing sheet for: {recipient_email}")
-            leads_df = fetch_google_sheet(sheet_link)
-            start_conversion(leads_df, recipient_email)
+            valid_users.append(user)
+
+        # 3) Fetch all sheets at once (skipping ones unchanged since they were
+        #    last processed, and reusing sheets the Sellerboard updater just
+        #    parsed), then convert and email each user's sheet
+        sheet_cache = get_sheet_cache(CONFIG_S3_BUCKET, "prep")
+        leads_cache = get_leads_cache(CONFIG_S3_BUCKET, "prep")
+        user_metrics = [StageMetrics("prep", user=user["email"]) for user in valid_users]
+        user_results = fetch_user_sheets(
+            valid_users, sheet_cache, since=last_processed_date, user_metrics=user_metrics, leads_cache=leads_cache
+        )
+        failed_fetches = []
+        for user, result, metrics in zip(valid_users, user_results, user_metrics):
+            leads_df = result.pop("leads_df", None)
+            if "error" in result:
+                print(f"Error fetching sheet for {result['email']}: {result['error']}")
+                result["status"] = "fetch_failed"
+                failed_fetches.append(result)
+            elif leads_df is None:
+                print(f"No changes in sheet for: {result['email']}")
+                result["status"] = "unchanged"
+                send_notification_email(
+                    result["email"],
+                    "No new purchases to process",
+                    "There are no new purchases to process.",
+                    metrics
+                )
+            else:
+                from common.row_index import RowIndex, row_index_key
+
+                # Drop rows already sent in an earlier run (e.g. the watermark day)
+                with metrics.stage("s3_row_index"):
+                    row_index = RowIndex(CONFIG_S3_BUCKET, row_index_key("prep", result["email"]))
+                leads_df = leads_df[row_index.new_rows_mask(leads_df)].copy()
+                result["new_rows"] = len(leads_df)
+                metrics.count("new_rows", len(leads_df))
+
+                print(f"Processing sheet for: {result['email']}")
+                start = time.perf_counter()
+                result["latest_date"] = start_conversion(leads_df, result["email"], last_processed_date, metrics)
+                result["convert_seconds"] = round(time.perf_counter() - start, 3)
+                result["status"] = "completed"
+                if result["latest_date"] is not None:
+                    with metrics.stage("s3_row_index"):
+                        row_index.add(leads_df)
+                        row_index.save(prune_before=last_processed_date)
+                    sheet_cache.mark_processed(user["sheet"])
+            metrics.emit()
+            result["metrics"] = metrics.summary()
+        with invocation_metrics.stage("sheet_cache_save"):
+            sheet_cache.save()
+
+        # Keep the watermark where it is if any sheet could not be fetched,
+        # so those users' purchases are picked up on the next run.
+        if failed_fetches:
+            failed_emails = ", ".join(result["email"] for result in failed_fetches)
+            raise RuntimeError(
+                f"Failed to fetch sheets for: {failed_emails}\n\n"
+                f"Per-user results:\n{json.dumps(user_results, indent=2)}"
+            )
         
         current_date = datetime.now(ZoneInfo("America/New_York")).strftime('%Y-%m-%d')
         print(current_date)
-        update_last_processed_date(current_date)
+        with invocation_metrics.stage("s3_config_write"):
+            update_last_processed_date(current_date)
         print(f"Final last processed date updated to: {current_date}")
 
-        return {"statusCode": 200, "body": "Process completed for all sheets."}
+        invocation_metrics.emit()
+        return {
+            "statusCode": 200,
+            "body": json.dumps({
+                "message": "Process completed for all sheets.",
+                "users": user_results,
+                "emails": mailer.results,
+                "metrics": invocation_metrics.summary()
+            })
+        }
 
     except Exception as e:
         # Include the console log in the error email
@@ -281,5 +377,6 @@ def lambda_handler(event, context):
         return {"statusCode": 500, "body": error_message}
 
     finally:
+        mailer.close()
         # Restore original stdout
         sys.stdout = original_stdout
@@ -1,16 +1,23 @@
-import json
 import os
+import sys
 import pandas as pd
 import requests
 import smtplib
 import ssl
 from email.message import EmailMessage
 from dotenv import load_dotenv
-import boto3
 from io import StringIO
 import csv
 from datetime import datetime, timezone
 
+# Make the repo-level common/ package importable when run from this folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.sheet_client import fetch_sheet_text
+from common.leads_cache import LEADS_COLUMNS
+from common.leads_csv import read_recent_leads
+from common.storage import read_json, write_json
+from if_prep_sheet import convert_leads
+
 # Load environment variables
 load_dotenv()
 
@@ -27,11 +34,9 @@ OSCAR_EMAIL = os.getenv("OSCAR_EMAIL")
 
 def get_last_processed_date():
     """Retrieve the last processed date from the config file in S3."""
-    s3_client = boto3.client('s3')
     config_key = "config.json"
     try:
-        response = s3_client.get_object(Bucket=CONFIG_S3_BUCKET, Key=config_key)
-        config_data = json.loads(response['Body'].read().decode('utf-8'))
+        config_data = read_json(CONFIG_S3_BUCKET, config_key)
         return config_data.get("last_processed_date", "2000-01-01")
     except Exception as e:
         print(f"Error fetching last processed date: {e}")
@@ -40,11 +45,9 @@ def get_last_processed_date():
 
 def update_last_processed_date(new_date):
     """Update the last processed date in the config file stored in S3."""
-    s3_client = boto3.client('s3')
     config_key = "config.json"
-    new_config = json.dumps({"last_processed_date": new_date})
     try:
-        s3_client.put_object(Bucket=CONFIG_S3_BUCKET, Key=config_key, Body=new_config)
+        write_json(CONFIG_S3_BUCKET, config_key, {"last_processed_date": new_date})
         print(f"Updated last processed date to: {new_date} in S3.")
     except Exception as e:
         print(f"Error updating last processed date: {e}")
@@ -98,13 +101,17 @@ def send_email(attachment_data, attachment_filename, recipient_email):
         print(f"Failed to send email: {e}")
 
 
-def fetch_google_sheet(url):
-    """Fetches the Google Sheet CSV data and returns a pandas DataFrame."""
+def fetch_google_sheet(url, since=None):
+    """
+    Fetches the Google Sheet CSV data and returns a pandas DataFrame.
+    With `since`, only rows dated on or after it are parsed.
+    """
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        csv_data = StringIO(response.text)
-        df = pd.read_csv(csv_data, dtype=str)
+        csv_text = fetch_sheet_text(url)
+        if since is None:
+            df = pd.read_csv(StringIO(csv_text), dtype=str)
+        else:
+            df = read_recent_leads(csv_text, since, columns=LEADS_COLUMNS)
         print("Google Sheet data fetched successfully.")
         return df
     except requests.exceptions.RequestException as e:
@@ -115,7 +122,7 @@ def fetch_google_sheet(url):
         raise
 
 
-def start_conversion(leads_df, recipient_email):
+def start_conversion(leads_df, recipient_email, last_processed_date):
     """
     Converts the leads sheet to match the Instant Fulfillment template,
     filtering by last processed date and sending the result via email.
@@ -128,8 +135,6 @@ def start_conversion(leads_df, recipient_email):
     print("Starting conversion...")
 
     try:
-        # Get last processed date
-        last_processed_date = get_last_processed_date()
         leads_df["Date"] = pd.to_datetime(leads_df["Date"], errors="coerce")
         
         # Find all dates after last_processed_date
@@ -147,61 +152,8 @@ def start_conversion(leads_df, recipient_email):
         # Filter to include all rows from earliest_date onward
         leads_df = leads_df[leads_df["Date"] >= earliest_date]
 
-        # Define the headers we want to use manually
-        REQUIRED_HEADERS = [
-            "Order Date", "Supplier / Retailer", "Item Name / Description",
-            "Size / Color", "Bundled?", "# Units in Bundle", "# Units Expected",
-            "ASIN", "COGS", "Requested List Price", "Seller Notes / Prep Request",
-            "Tracking #", "Custom MSKU", "Order #", "UPC #", "FBA or FBM"
-        ]
-
-        output_data = []
-
-        for _, row in leads_df.iterrows():
-            # Format the date to "YYYY-MM-DD"
-            date_value = row.get("Date", "")
-            if pd.isnull(date_value):
-                date_str = ""
-            else:
-                date_str = date_value.strftime("%Y-%m-%d")
-
-            # Remove $ symbols and handle non-numeric sale prices
-            sale_price_str = str(row.get("Sale Price", "0")).replace("$", "").replace(",", "").strip()
-            try:
-                sale_price = float(sale_price_str)
-                requested_price = round(sale_price * 1.15, 2)
-            except ValueError:
-                requested_price = ""  # If Sale Price is not a valid number, set to empty
-
-            # Ensure "Prep Notes" is empty if it is null
-            prep_notes = row.get("Prep Notes", "")
-            if pd.isna(prep_notes):
-                prep_notes = ""
-
-            mapped_row = {
-                "Order Date": date_str,  # Use formatted date here
-                "Supplier / Retailer": "N/A",
-                "Item Name / Description": str(row.get("Name", "")),
-                "Size / Color": str(row.get("Size/Color", "N/A")),
-                "Bundled?": "Yes" if pd.notna(row.get("Bundled?")) and str(row.get("Bundled?")).strip() != "" else "No",
-                "# Units in Bundle": str(row.get("Bundled?", "")) if pd.notna(row.get("Bundled?")) else "",
-                "# Units Expected": str(row.get("Amount Purchased", "")),
-                "ASIN": str(row.get("ASIN", "")),
-                "COGS": str(row.get("COGS", "")),
-                "Requested List Price": "Replen" if "REPLEN" in sale_price_str.upper() else str(requested_price),
-                "Seller Notes / Prep Request": prep_notes,
-                "Tracking #": "",
-                "Custom MSKU": "",
-                "Order #": str(row.get("Order #", "")),
-                "UPC #": "",
-                "FBA or FBM": "FBA"
-            }
-            output_data.append(mapped_row)
-
-        # Convert to DataFrame using our required headers
-        output_df = pd.DataFrame(output_data)
-        output_df = output_df.reindex(columns=REQUIRED_HEADERS, fill_value="")
-        output_df = output_df.astype(str)
+        # Map the leads columns onto the IF Prep Sheet headers
+        output_df = convert_leads(leads_df)
 
         # Write the DataFrame to a CSV in memory
         csv_buffer = StringIO()
@@ -229,17 +181,19 @@ def start_conversion(leads_df, recipient_email):
 def lambda_handler(event, context):
     """AWS Lambda Entry Point."""
     try:
+        last_processed_date = get_last_processed_date()
+
         # Process Tevin's sheet
-        leads_df1 = fetch_google_sheet(TEVIN_SHEET)
-        tevin_latest = start_conversion(leads_df1, TEVIN_EMAIL)
+        leads_df1 = fetch_google_sheet(TEVIN_SHEET, since=last_processed_date)
+        tevin_latest = start_conversion(leads_df1, TEVIN_EMAIL, last_processed_date)
 
         # Process David's sheet
-        leads_df2 = fetch_google_sheet(DAVID_SHEET)
-        david_latest = start_conversion(leads_df2, DAVID_EMAIL)
+        leads_df2 = fetch_google_sheet(DAVID_SHEET, since=last_processed_date)
+        david_latest = start_conversion(leads_df2, DAVID_EMAIL, last_processed_date)
 
         # Process Oscar's sheet
-        leads_df3 = fetch_google_sheet(OSCAR_SHEET)
-        oscar_latest = start_conversion(leads_df3, OSCAR_EMAIL)
+        leads_df3 = fetch_google_sheet(OSCAR_SHEET, since=last_processed_date)
+        oscar_latest = start_conversion(leads_df3, OSCAR_EMAIL, last_processed_date)
 
         # Instead of using the latest date from the sheets,
         # update the config with the current date (UTC) as the processed date.
@@ -0,0 +1,110 @@
+"""
+Benchmark for the Aura cost fill (common.aura_costs).
+
+Compares the previous row-by-row fill (an iterrows loop with a sheet scan per
+missing cost) against the vectorized first-match lookup, and checks that both
+produce the same costs and updated_rows summary. Run from the repository root:
+
+    python benchmarks/bench_aura_fill.py
+"""
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+# harness puts the repository root on sys.path, so it comes before common
+import harness  # noqa: F401
+from common.aura_costs import fill_missing_costs, first_cogs_by_asin
+
+AURA_SIZES = [1_000, 5_000, 20_000]
+SHEET_ROWS_PER_AURA_ROW = 2
+LOOP_MAX_ROWS = 5_000
+REPEATS = 3
+
+
+def make_asin(rng):
+    return f"B0{rng.randrange(10**8):08d}"
+
+
+def make_inputs(n_rows, rng):
+    """Builds an aura export (about half the costs missing) and a cost sheet."""
+    asins = [make_asin(rng) for _ in range(n_rows)]
+    aura_df = pd.DataFrame({
+        "asin": asins,
+        "cost": [np.nan if rng.random() < 0.5 else round(rng.uniform(2, 60), 2) for _ in range(n_rows)],
+    })
+    sheet_asins = [
+        rng.choice(asins) if rng.random() < 0.6 else make_asin(rng)
+        for _ in range(n_rows * SHEET_ROWS_PER_AURA_ROW)
+    ]
+    sheet_df = pd.DataFrame({
+        "ASIN": sheet_asins,
+        "COGS": [np.nan if rng.random() < 0.1 else round(rng.uniform(2, 60), 2) for _ in sheet_asins],
+    })
+    return aura_df, sheet_df
+
+
+def loop_fill(aura_df, sheet_df):
+    """The fill as it was written before common.aura_costs."""
+    updated_rows = []
+    for index, row in aura_df.iterrows():
+        if pd.isna(row['cost']):
+            match = sheet_df[sheet_df['ASIN'] == row['asin']]
+            if not match.empty:
+                new_cost = match.iloc[0]['COGS']
+                if not pd.isna(new_cost):
+                    aura_df.at[index, 'cost'] = float(new_cost)
+                    updated_rows.append({
+                        'index': index,
+                        'asin': row['asin'],
+                        'old_cost': row['cost'],
+                        'new_cost': float(new_cost)
+                    })
+    return updated_rows
+
+
+def time_fill(fill, aura_df, sheet_df):
+    times = []
+    for _ in range(REPEATS):
+        working_df = aura_df.copy()
+        start = time.perf_counter()
+        updated_rows = fill(working_df, sheet_df)
+        times.append(time.perf_counter() - start)
+    return min(times), working_df, updated_rows
+
+
+def vectorized_fill(aura_df, sheet_df):
+    return fill_missing_costs(aura_df, first_cogs_by_asin(sheet_df))
+
+
+def same_summary(left, right):
+    if len(left) != len(right):
+        return False
+    for a, b in zip(left, right):
+        if (a['index'], a['asin'], a['new_cost']) != (b['index'], b['asin'], b['new_cost']):
+            return False
+        if not (pd.isna(a['old_cost']) and pd.isna(b['old_cost'])):
+            return False
+    return True
+
+
+def main():
+    print(f"{'rows':>8} | {'filled':>7} | {'loop (s)':>9} | {'vectorized (s)':>14} | {'match':>5}")
+    for n_rows in AURA_SIZES:
+        aura_df, sheet_df = make_inputs(n_rows, random.Random(n_rows))
+
+        fast_time, fast_df, fast_rows = time_fill(vectorized_fill, aura_df, sheet_df)
+        if n_rows <= LOOP_MAX_ROWS:
+            loop_time, loop_df, loop_rows = time_fill(loop_fill, aura_df, sheet_df)
+            matches = fast_df.equals(loop_df) and same_summary(fast_rows, loop_rows)
+            loop_cell = f"{loop_time:>9.4f}"
+            match_cell = "yes" if matches else "NO"
+        else:
+            loop_cell = f"{'skipped':>9}"
+            match_cell = "-"
+        print(f"{n_rows:>8} | {len(fast_rows):>7} | {loop_cell} | {fast_time:>14.4f} | {match_cell:>5}")
+
+
+if __name__ == "__main__":
+    main()
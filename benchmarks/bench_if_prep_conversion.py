@@ -0,0 +1,114 @@
+"""
+Benchmark for the Instant Fulfillment prep sheet conversion (if_prep_sheet.convert_leads).
+
+Compares the previous row-by-row conversion (an iterrows loop building a dict
+per row) against convert_leads on synthetic leads sheets of increasing size,
+checks that both produce the same sheet, and times writing it to CSV the same
+way start_conversion does. Run from the repository root:
+
+    python benchmarks/bench_if_prep_conversion.py
+"""
+import csv
+import random
+import sys
+import time
+from io import StringIO
+
+import pandas as pd
+
+from harness import PREP_CONFIG_DIR
+from synthetic import SHEET_DATE_FORMAT, make_purchase_sheet
+
+sys.path.append(PREP_CONFIG_DIR)
+from if_prep_sheet import REQUIRED_HEADERS, convert_leads  # noqa: E402
+
+SHEET_SIZES = [1_000, 10_000, 100_000]
+LOOP_MAX_ROWS = 10_000
+REPEATS = 3
+
+
+def make_leads(n_rows, rng):
+    """Builds a leads sheet as fetch_google_sheet returns it (text columns, parsed Date)."""
+    leads_df = make_purchase_sheet(n_rows, rng)
+    leads_df["Date"] = pd.to_datetime(leads_df["Date"], format=SHEET_DATE_FORMAT)
+    # Blank cells come back from read_csv as NaN
+    return leads_df.replace("", None)
+
+
+def loop_convert(leads_df):
+    """The conversion as start_conversion wrote it before if_prep_sheet."""
+    output_data = []
+
+    for _, row in leads_df.iterrows():
+        date_value = row.get("Date", "")
+        date_str = "" if pd.isnull(date_value) else date_value.strftime("%Y-%m-%d")
+
+        sale_price_str = str(row.get("Sale Price", "0")).replace("$", "").replace(",", "").strip()
+        try:
+            sale_price = float(sale_price_str)
+            requested_price = round(sale_price * 1.15, 2)
+        except ValueError:
+            requested_price = ""
+
+        prep_notes = row.get("Prep Notes", "")
+        if pd.isna(prep_notes):
+            prep_notes = ""
+
+        mapped_row = {
+            "Order Date": date_str,
+            "Supplier / Retailer": "N/A",
+            "Item Name / Description": str(row.get("Name", "")),
+            "Size / Color": str(row.get("Size/Color", "N/A")),
+            "Bundled?": "Yes" if pd.notna(row.get("Bundled?")) and str(row.get("Bundled?")).strip() != "" else "No",
+            "# Units in Bundle": str(row.get("Bundled?", "")) if pd.notna(row.get("Bundled?")) else "",
+            "# Units Expected": str(row.get("Amount Purchased", "")),
+            "ASIN": str(row.get("ASIN", "")),
+            "COGS": str(row.get("COGS", "")),
+            "Requested List Price": "Replen" if "REPLEN" in sale_price_str.upper() else str(requested_price),
+            "Seller Notes / Prep Request": prep_notes,
+            "Tracking #": "",
+            "Custom MSKU": "",
+            "Order #": str(row.get("Order #", "")),
+            "UPC #": "",
+            "FBA or FBM": "FBA"
+        }
+        output_data.append(mapped_row)
+
+    output_df = pd.DataFrame(output_data)
+    output_df = output_df.reindex(columns=REQUIRED_HEADERS, fill_value="")
+    return output_df.astype(str)
+
+
+def time_convert(convert, leads_df):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        output_df = convert(leads_df)
+        times.append(time.perf_counter() - start)
+    return min(times), output_df
+
+
+def main():
+    print(f"{'rows':>8} | {'loop (s)':>9} | {'convert (s)':>11} | {'to_csv (s)':>10} | same")
+    for n_rows in SHEET_SIZES:
+        leads_df = make_leads(n_rows, random.Random(n_rows))
+
+        convert_time, output_df = time_convert(convert_leads, leads_df)
+        if n_rows <= LOOP_MAX_ROWS:
+            loop_time, loop_df = time_convert(loop_convert, leads_df)
+            loop_text = f"{loop_time:>9.4f}"
+            same = "yes" if loop_df.equals(output_df) else "NO"
+        else:
+            loop_text = f"{'skipped':>9}"
+            same = "-"
+
+        csv_times = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            output_df.to_csv(StringIO(), index=False, header=True, quoting=csv.QUOTE_ALL)
+            csv_times.append(time.perf_counter() - start)
+        print(f"{n_rows:>8} | {loop_text} | {convert_time:>11.4f} | {min(csv_times):>10.4f} | {same:>4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark for the Sellerboard ASIN join in leadstoamznandsb_v2.apply_purchases.
+
+Times the purchase-to-Sellerboard classification against synthetic Sellerboard
+catalogs of increasing size and reports peak Python memory (tracemalloc). The
+"spree" scenario makes every purchase a new product. Run from the repository root:
+
+    python benchmarks/bench_process_sheet.py
+"""
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from harness import load_sb_updater
+from synthetic import make_asin, make_sellerboard
+
+SB_SIZES = [1_000, 10_000, 50_000]
+PURCHASE_ROWS = 500
+REPEATS = 3
+SCENARIOS = {"mixed": 0.3, "spree": 1.0}
+
+
+def make_purchases(n_rows, sb_size, rng, new_share=0.3):
+    """
+    Builds purchase rows mixing known ASINs, new ASINs and Replen entries, already
+    cleaned the way process_sheet hands them to apply_purchases.
+    """
+    rows = []
+    for _ in range(n_rows):
+        if rng.random() >= new_share:
+            asin = make_asin(rng.randrange(sb_size))
+        else:
+            asin = make_asin(sb_size + rng.randrange(n_rows))
+        rows.append({
+            'ASIN': asin,
+            'Name': f"Purchased {asin}",
+            'COGS': round(rng.uniform(2, 60), 2),
+            'Sale Price': "Replen" if rng.random() < 0.1 else f"{rng.uniform(10, 120):.2f}",
+        })
+    return pd.DataFrame(rows)
+
+
+class ListingLoaderSheet:
+    """Minimal stand-in for the openpyxl Template sheet; only append() is used."""
+
+    def __init__(self):
+        self.rows = []
+
+    def append(self, row):
+        self.rows.append(row)
+
+
+def main():
+    sb_updater = load_sb_updater()
+    headers = sb_updater.LISTING_LOADER_COLUMNS + [None] * 60
+    col_indices = {col: headers.index(col) + 1 for col in sb_updater.LISTING_LOADER_COLUMNS}
+
+    print(f"{'scenario':>8} | {'SB rows':>10} | {'purchase rows':>13} | {'best (s)':>9} | {'peak (MiB)':>10}")
+    for scenario, new_share in SCENARIOS.items():
+        for sb_size in SB_SIZES:
+            rng = random.Random(sb_size)
+            sb_df = make_sellerboard(sb_size, rng)
+            purchases = make_purchases(PURCHASE_ROWS, sb_size, rng, new_share)
+
+            timings = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                sb_updater.apply_purchases(purchases, sb_df.copy(), ListingLoaderSheet(), headers, col_indices)
+                timings.append(time.perf_counter() - start)
+
+            working_copy = sb_df.copy()
+            tracemalloc.start()
+            sb_updater.apply_purchases(purchases, working_copy, ListingLoaderSheet(), headers, col_indices)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{scenario:>8} | {sb_size:>10} | {PURCHASE_ROWS:>13} | {min(timings):>9.4f} | {peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
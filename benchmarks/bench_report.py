@@ -0,0 +1,145 @@
+"""
+Benchmark for the COGS report email body (common.cogs_report).
+
+Compares the previous builder (html_content += per row, full inline style on
+every cell, no row cap) with render_report, showing render time and HTML size
+per table size, plus the size of the CSV attachment that carries the rows cut
+from the email. Run from the repository root:
+
+    python benchmarks/bench_report.py
+"""
+import random
+import time
+
+# harness puts the repository root on sys.path, so it comes before common
+import harness  # noqa: F401
+from common.cogs_report import render_report, report_csv, report_truncated
+
+ROWS_PER_TABLE = [50, 500, 5_000, 20_000]
+REPEATS = 3
+
+
+def make_updates(n_rows, rng):
+    """Builds the three report tables with n_rows rows each."""
+    def row(i):
+        return {"ASIN": f"B0{i:08d}", "SKU": f"SKU-{i:08d}", "Name": f"Purchased product {i} & co"}
+
+    actual_updates = [{**row(i), "new_cost": rng.uniform(2, 60)} for i in range(n_rows)]
+    potential_updates = [
+        {**row(i), "old_cost": rng.uniform(2, 60), "new_cost": rng.uniform(2, 60)} for i in range(n_rows)
+    ]
+    new_products = [{**row(i), "cost": rng.uniform(2, 60)} for i in range(n_rows)]
+    return actual_updates, potential_updates, new_products
+
+
+def concat_report(actual_updates, potential_updates, new_products):
+    """The report body as send_email built it before common.cogs_report."""
+    html_content = """<html>
+    <body>
+        <h2 style="color: #2c3e50;">Amazon New Listings & COGS Report</h2>
+        <div style="margin-bottom: 30px;">"""
+    
+    if actual_updates:
+        html_content += """
+        <h3 style="color: #34495e;">Completed Cost Updates</h3>
+        <table style="border-collapse: collapse; width: 100%; margin-bottom: 20px;">
+            <tr style="background-color: #f8f9fa;">
+                <th style="padding: 12px; border: 1px solid #ddd;">ASIN</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">SKU</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">Name</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">New Cost</th>
+            </tr>"""
+        for update in actual_updates:
+            html_content += f"""
+            <tr>
+                <td style="padding: 12px; border: 1px solid #ddd;">{update['ASIN']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">{update['SKU']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">{update['Name']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">${update['new_cost']:.2f}</td>
+            </tr>"""
+        html_content += "</table>"
+    
+    if potential_updates:
+        html_content += """
+        <h3 style="color: #34495e;">Potential COGS Updates</h3>
+        <table style="border-collapse: collapse; width: 100%; margin-bottom: 20px;">
+            <tr style="background-color: #f8f9fa;">
+                <th style="padding: 12px; border: 1px solid #ddd;">ASIN</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">SKU</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">Name</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">Old Cost</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">New Cost</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">Difference</th>
+            </tr>"""
+        for update in potential_updates:
+            diff = update['new_cost'] - update['old_cost']
+            diff_color = "#e74c3c" if diff > 0 else "#27ae60"
+            html_content += f"""
+            <tr>
+                <td style="padding: 12px; border: 1px solid #ddd;">{update['ASIN']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">{update['SKU']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">{update['Name']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">${update['old_cost']:.2f}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">${update['new_cost']:.2f}</td>
+                <td style="padding: 12px; border: 1px solid #ddd; color: {diff_color};">
+                    {diff:+.2f}
+                </td>
+            </tr>"""
+        html_content += "</table>"
+    
+    if new_products:
+        html_content += """
+        <h3 style="color: #34495e;">New Products Added</h3>
+        <table style="border-collapse: collapse; width: 100%;">
+            <tr style="background-color: #f8f9fa;">
+                <th style="padding: 12px; border: 1px solid #ddd;">ASIN</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">SKU</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">Name</th>
+                <th style="padding: 12px; border: 1px solid #ddd;">Initial Cost</th>
+            </tr>"""
+        for product in new_products:
+            html_content += f"""
+            <tr>
+                <td style="padding: 12px; border: 1px solid #ddd;">{product['ASIN']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">{product['SKU']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">{product['Name']}</td>
+                <td style="padding: 12px; border: 1px solid #ddd;">${product['cost']:.2f}</td>
+            </tr>"""
+        html_content += "</table>"
+    
+    html_content += """
+        </div>
+        <p style="color: #7f8c8d;">
+            Note: Potential COGS updates are suggestions only. No actual changes have been made to existing items.
+            <br>Attached files contain new product listings and updated prices within Sellerboard.
+        </p>
+    </body>
+    </html>"""
+    
+    return html_content
+
+
+def best_time(build, *args):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = build(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    print(f"{'rows/table':>10} | {'concat (s)':>10} | {'concat KB':>9} | {'render (s)':>10} | {'render KB':>9} | {'csv KB':>7}")
+    for n_rows in ROWS_PER_TABLE:
+        tables = make_updates(n_rows, random.Random(n_rows))
+        concat_time, concat_html = best_time(concat_report, *tables)
+        render_time, render_html = best_time(render_report, *tables)
+        csv_kb = f"{len(report_csv(*tables)) / 1024:>7.0f}" if report_truncated(*tables) else f"{'-':>7}"
+        print(
+            f"{n_rows:>10} | {concat_time:>10.4f} | {len(concat_html.encode('utf-8')) / 1024:>9.0f} | "
+            f"{render_time:>10.4f} | {len(render_html.encode('utf-8')) / 1024:>9.0f} | {csv_kb}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark for the Sellerboard xlsx export (leadstoamznandsb_v2.sellerboard_to_xlsx).
+
+Compares the default write-only export with the DataFrame.to_excel export the
+updater used before (kept here as a reference) for synthetic catalogs of
+10k/50k/200k rows. Each measurement runs in a fresh subprocess so the reported
+peak RSS belongs to that export alone. It also checks that the Sellerboard
+columns read back identically from both files. Run from the repository root:
+
+    python benchmarks/bench_sellerboard_xlsx.py
+"""
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from harness import load_sb_updater
+from synthetic import make_sellerboard
+
+SB_SIZES = [10_000, 50_000, 200_000]
+WRITERS = ["to_excel", "write_only"]
+SELLERBOARD_COLUMNS = ['ASIN', 'SKU', 'Title', 'Labels', 'Cost', 'VAT_CATEGORY', 'Hide']
+ROUND_TRIP_ROWS = 2_000
+
+
+def to_excel_export(sb_df):
+    """The export as write_sellerboard_xlsx did it before sellerboard_to_xlsx."""
+    sb_buffer = io.BytesIO()
+    sb_df.to_excel(sb_buffer, index=False, engine='openpyxl')
+    sb_buffer.seek(0)
+    return sb_buffer
+
+
+def exporter(writer):
+    """Returns the export function for a writer name in WRITERS."""
+    if writer == "to_excel":
+        return to_excel_export
+    os.environ["SB_XLSX_WRITER"] = "write_only"
+    return load_sb_updater().sellerboard_to_xlsx
+
+
+def run_export(writer, n_rows):
+    """Exports one catalog with the given writer; prints time and RSS as JSON."""
+    export = exporter(writer)
+    sb_df = make_sellerboard(n_rows, random.Random(n_rows))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    sb_buffer = export(sb_df)
+    seconds = time.perf_counter() - start
+
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "seconds": seconds,
+        "rss_before_mib": rss_before / 1024,
+        "rss_peak_mib": rss_peak / 1024,
+        "bytes": len(sb_buffer.getvalue())
+    }))
+
+
+def check_round_trip():
+    """Returns True if both writers produce the same Sellerboard columns when read back."""
+    frames = []
+    for writer in WRITERS:
+        export = exporter(writer)
+        sb_df = make_sellerboard(ROUND_TRIP_ROWS, random.Random(ROUND_TRIP_ROWS))
+        frames.append(pd.read_excel(export(sb_df))[SELLERBOARD_COLUMNS])
+    try:
+        pd.testing.assert_frame_equal(frames[0], frames[1])
+    except AssertionError as e:
+        print(e)
+        return False
+    return True
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_export(sys.argv[2], int(sys.argv[3]))
+        return
+
+    print(f"{'SB rows':>8} | {'writer':>10} | {'time (s)':>8} | {'peak RSS (MiB)':>14} | {'RSS growth (MiB)':>16}")
+    for n_rows in SB_SIZES:
+        results = {}
+        for writer in WRITERS:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", writer, str(n_rows)],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            results[writer] = result
+            growth = result["rss_peak_mib"] - result["rss_before_mib"]
+            print(f"{n_rows:>8} | {writer:>10} | {result['seconds']:>8.2f} | "
+                  f"{result['rss_peak_mib']:>14.1f} | {growth:>16.1f}")
+        speedup = results["to_excel"]["seconds"] / results["write_only"]["seconds"]
+        print(f"{n_rows:>8} | write_only is {speedup:.2f}x faster than to_excel")
+
+    identical = check_round_trip()
+    print(f"Sellerboard columns round-trip identically: {'yes' if identical else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
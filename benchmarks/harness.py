@@ -0,0 +1,153 @@
+"""
+Loaders for the tool scripts and local stand-ins for S3, the Google Sheet HTTP
+export and SMTP, so the benchmarks run the real code paths without network access.
+"""
+import hashlib
+import importlib.util
+import os
+import sys
+from contextlib import contextmanager
+from unittest import mock
+
+import boto3
+import requests
+import smtplib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+SB_UPDATER_PATH = os.path.join(REPO_ROOT, "Cost Updater Tools", "LeadsToSCSB", "leadstoamznandsb_v2.py")
+PREP_CONFIG_DIR = os.path.join(REPO_ROOT, "PrepUploader", "config")
+PREP_LAMBDA_PATH = os.path.join(PREP_CONFIG_DIR, "lambda_function.py")
+
+BENCH_BUCKET = "bench-bucket"
+BENCH_SHEET_URL = "https://docs.google.com/spreadsheets/d/bench/export?format=csv"
+
+
+def load_script(name, path):
+    """Imports a tool script by path with placeholder configuration."""
+    os.environ.setdefault("CONFIG_S3_BUCKET", BENCH_BUCKET)
+    os.environ.setdefault("TEVIN_SHEET", BENCH_SHEET_URL)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_sb_updater():
+    """Imports the Sellerboard updater Lambda (leadstoamznandsb_v2.py)."""
+    return load_script("leadstoamznandsb_v2", SB_UPDATER_PATH)
+
+
+def load_prep_lambda():
+    """Imports the Prep Uploader Lambda (lambda_function.py) with its config folder on the path."""
+    if PREP_CONFIG_DIR not in sys.path:
+        sys.path.append(PREP_CONFIG_DIR)
+    return load_script("prep_lambda_function", PREP_LAMBDA_PATH)
+
+
+class StubBody:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class StubS3:
+    """In-memory S3 client covering the calls made through common.storage."""
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.metadata = {}
+        self.bytes_written = 0
+
+    def _missing(self, key):
+        return Exception(f"NoSuchKey: {key}")
+
+    def _etag(self, key):
+        return '"%s"' % hashlib.md5(self.objects[key]).hexdigest()
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects:
+            raise self._missing(Key)
+        return {
+            "Body": StubBody(self.objects[Key]),
+            "ETag": self._etag(Key),
+            "Metadata": self.metadata.get(Key, {}),
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects:
+            raise self._missing(Key)
+        return {
+            "ETag": self._etag(Key),
+            "ContentLength": len(self.objects[Key]),
+            "Metadata": self.metadata.get(Key, {}),
+        }
+
+    def put_object(self, Bucket, Key, Body, Metadata=None, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif hasattr(Body, "read"):
+            Body = Body.read()
+        self.objects[Key] = bytes(Body)
+        self.metadata[Key] = Metadata or {}
+        self.bytes_written += len(Body)
+        return {"ETag": self._etag(Key)}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.status_code = 200
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+
+class StubSMTP:
+    """Accepts messages like smtplib.SMTP_SSL and keeps their serialized sizes."""
+
+    sent = []
+
+    def __init__(self, host, port, context=None):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        StubSMTP.sent.append(len(msg.as_bytes()))
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def stubbed_services(s3, sheets):
+    """
+    Routes boto3 S3 clients to `s3`, sheet downloads to the {url: csv_text} map
+    and SMTP_SSL to StubSMTP for the duration of the block.
+    """
+    from common import storage
+
+    def get_sheet(self, url, *args, **kwargs):
+        return StubResponse(sheets[url])
+
+    storage._clients.clear()
+    StubSMTP.sent = []
+    with mock.patch.object(boto3, "client", lambda *args, **kwargs: s3), \
+            mock.patch.object(requests.Session, "get", get_sheet), \
+            mock.patch.object(smtplib, "SMTP_SSL", StubSMTP):
+        try:
+            yield
+        finally:
+            storage._clients.clear()
@@ -0,0 +1,315 @@
+"""
+Benchmark suite for the Prep Uploader, the Sellerboard updater and the Aura fill.
+
+For each size (purchase rows) it generates synthetic inputs, times every stage
+against local S3 / HTTP / SMTP stubs and writes the results as JSON. The
+Sellerboard catalog is SB_ROWS_PER_PURCHASE times the purchase sheet and the
+aura export is AURA_ROWS_PER_PURCHASE times it. Pass --compare with an earlier
+results file to see the change per stage. Each Lambda entry point is also
+imported in a fresh interpreter with -X importtime to track its cold start and
+the slowest imports. Run from the repository root:
+
+    python benchmarks/run_suite.py
+    python benchmarks/run_suite.py --sizes 1000,10000 --compare benchmarks/results/baseline.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# harness puts the repository root on sys.path, so it comes before synthetic and common
+from harness import (
+    BENCH_BUCKET, BENCH_SHEET_URL, PREP_CONFIG_DIR, PREP_LAMBDA_PATH, SB_UPDATER_PATH,
+    StubS3, StubSMTP, load_prep_lambda, load_sb_updater, stubbed_services
+)
+import synthetic
+from common.aura_costs import fill_missing_costs, first_cogs_by_asin
+from common.leads_cache import LEADS_CACHE_ENABLED, S3LeadsCache
+
+DEFAULT_SIZES = [1_000, 5_000]
+SB_ROWS_PER_PURCHASE = 5
+AURA_ROWS_PER_PURCHASE = 5
+REPEATS = 3
+SINCE = "2025-01-01"
+RECIPIENT = "bench@example.com"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SLOWEST_IMPORTS = 8
+
+# Imports a Lambda entry point the way the runtime does during init
+COLD_START_SCRIPT = """
+import importlib.util, sys, time
+sys.path.append({config_dir!r})
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("lambda_entry_point", {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(time.perf_counter() - start)
+"""
+
+
+def best_of(run, repeats, setup=None):
+    """
+    Calls run(setup()) `repeats` times, timing only run. Returns the best time
+    and the value returned by the last run.
+    """
+    best = None
+    value = None
+    for _ in range(repeats):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        value = run(state)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, value
+
+
+def record(results, stage, size, rows, seconds, **extra):
+    results.append({
+        "stage": stage,
+        "size": size,
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "rows_per_second": round(rows / seconds) if seconds and rows else None,
+        **extra
+    })
+
+
+def parse_importtime(stderr):
+    """Returns the top-level imports from -X importtime output as (module, cumulative ms), slowest first."""
+    imports = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        module = parts[2][1:]
+        # Nested imports are indented under the module that triggered them
+        if not module.startswith(" "):
+            imports.append((module, int(parts[1]) / 1000))
+    return sorted(imports, key=lambda item: item[1], reverse=True)
+
+
+def profile_cold_start(name, path, results):
+    """
+    Imports a Lambda entry point in a fresh interpreter with -X importtime, as in a
+    Lambda init (AWS_LAMBDA_FUNCTION_NAME set), and records how long it took along
+    with the slowest top-level imports.
+    """
+    env = dict(os.environ, AWS_LAMBDA_FUNCTION_NAME="bench", CONFIG_S3_BUCKET=BENCH_BUCKET)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", COLD_START_SCRIPT.format(config_dir=PREP_CONFIG_DIR, path=path)],
+        capture_output=True, text=True, env=env, check=True
+    )
+    seconds = float(completed.stdout.strip().splitlines()[-1])
+    slowest = parse_importtime(completed.stderr)[:SLOWEST_IMPORTS]
+    record(results, f"cold_start.{name}", 0, 0, seconds,
+           import_profile=[{"module": module, "cumulative_ms": round(ms, 1)} for module, ms in slowest])
+
+
+def bench_prep(prep, size, repeats, results):
+    """Prep Uploader: sheet fetch and parse, conversion, CSV write and the whole start_conversion."""
+    # The Lambda imports its converter lazily; load_prep_lambda put it on the path
+    from if_prep_sheet import convert_leads
+
+    sheet_df = synthetic.make_purchase_sheet(size, random.Random(size))
+    sheets = {BENCH_SHEET_URL: synthetic.purchase_sheet_csv(sheet_df)}
+
+    with stubbed_services(StubS3(), sheets):
+        seconds, leads_df = best_of(lambda _: prep.fetch_google_sheet(BENCH_SHEET_URL, since=SINCE), repeats)
+        record(results, "prep.fetch_parse", size, len(leads_df), seconds)
+
+        seconds, output_df = best_of(lambda _: convert_leads(leads_df), repeats)
+        record(results, "prep.convert", size, len(output_df), seconds)
+
+        def write_csv(_):
+            csv_buffer = StringIO()
+            output_df.to_csv(csv_buffer, index=False, header=True, quoting=csv.QUOTE_ALL)
+            return len(csv_buffer.getvalue())
+        seconds, csv_chars = best_of(write_csv, repeats)
+        record(results, "prep.write_csv", size, len(output_df), seconds, bytes=csv_chars)
+
+        seconds, _ = best_of(lambda df: prep.start_conversion(df, RECIPIENT, SINCE), repeats, setup=leads_df.copy)
+        record(results, "prep.start_conversion", size, len(leads_df), seconds, email_bytes=StubSMTP.sent[-1])
+        prep.mailer.close()
+
+
+def bench_sb(sb, size, repeats, results, template_bytes):
+    """Sellerboard updater: each stage of process_user, then process_user end to end."""
+    rng = random.Random(size)
+    catalog_size = size * SB_ROWS_PER_PURCHASE
+    sb_xlsx = synthetic.sellerboard_xlsx(synthetic.make_sellerboard(catalog_size, rng))
+    sheet_df = synthetic.make_purchase_sheet(size, rng, catalog_size)
+    sheets = {BENCH_SHEET_URL: synthetic.purchase_sheet_csv(sheet_df)}
+    initial_objects = {sb.LISTING_LOADER_KEY: template_bytes, "bench_sb.xlsx": sb_xlsx}
+    s3 = StubS3(initial_objects)
+    user = {
+        "name": f"bench-{size}",
+        "sheet_url": BENCH_SHEET_URL,
+        "sb_file_key": "bench_sb.xlsx",
+        "sb_updated_file": "bench_sb.xlsx",
+        "email": RECIPIENT
+    }
+
+    with stubbed_services(s3, sheets):
+        sb.listing_loader_cache["etag"] = None
+        sb.refresh_listing_loader_template()
+        wb, headers, col_indices = sb.checkout_listing_loader()
+        sb.release_listing_loader(wb)
+
+        seconds, purchases_df = best_of(lambda _: sb.fetch_google_sheet(BENCH_SHEET_URL, since=SINCE), repeats)
+        record(results, "sb.fetch_parse", size, len(purchases_df), seconds)
+
+        if LEADS_CACHE_ENABLED:
+            # The same sheet once the Prep Uploader has cached it
+            S3LeadsCache(BENCH_BUCKET, "prep").write(
+                BENCH_SHEET_URL, purchases_df, "bench", pd.to_datetime(SINCE)
+            )
+            leads_cache = S3LeadsCache(BENCH_BUCKET, "sb")
+            seconds, cached_df = best_of(
+                lambda _: sb.fetch_google_sheet(BENCH_SHEET_URL, since=SINCE, leads_cache=leads_cache), repeats
+            )
+            record(results, "sb.leads_cache_read", size, len(cached_df), seconds)
+
+        seconds, (sb_df, _) = best_of(lambda _: sb.load_sellerboard(user["sb_file_key"]), repeats)
+        record(results, "sb.load_sellerboard_xlsx", size, len(sb_df), seconds, bytes=len(sb_xlsx))
+
+        def new_workbook():
+            wb = load_workbook(filename=BytesIO(template_bytes), keep_vba=True)
+            return purchases_df.copy(), sb_df.copy(), wb
+
+        def process(state):
+            df, catalog_df, wb = state
+            return wb, sb.process_sheet(df, catalog_df, wb["Template"], headers, col_indices, SINCE)
+        seconds, (wb, processed) = best_of(process, repeats, setup=new_workbook)
+        updated_sb_df, new_products = processed[1], processed[3]
+        record(results, "sb.process_sheet", size, len(purchases_df), seconds, new_products=len(new_products))
+
+        def save_listing_loader(_):
+            buffer = BytesIO()
+            wb.save(buffer)
+            return len(buffer.getvalue())
+        seconds, workbook_bytes = best_of(save_listing_loader, repeats)
+        record(results, "sb.listing_loader_save", size, len(new_products), seconds, bytes=workbook_bytes)
+
+        seconds, sb_buffer = best_of(lambda _: sb.sellerboard_to_xlsx(updated_sb_df), repeats)
+        record(results, "sb.sellerboard_xlsx", size, len(updated_sb_df), seconds, bytes=len(sb_buffer.getvalue()))
+
+        seconds, _ = best_of(lambda _: sb.catalog_hash(updated_sb_df), repeats)
+        record(results, "sb.catalog_hash", size, len(updated_sb_df), seconds)
+
+        delta_df = sb.changed_catalog_rows(updated_sb_df, new_products, processed[4])
+        seconds, delta_buffer = best_of(lambda _: sb.sellerboard_to_xlsx(delta_df), repeats)
+        record(results, "sb.sellerboard_delta_xlsx", size, len(delta_df), seconds, bytes=len(delta_buffer.getvalue()))
+
+        def reset_store():
+            s3.objects = dict(initial_objects)
+            s3.metadata = {}
+            s3.bytes_written = 0
+        seconds, _ = best_of(lambda _: sb.process_user(user, SINCE), repeats, setup=reset_store)
+        record(results, "sb.process_user", size, len(purchases_df), seconds,
+               s3_bytes_written=s3.bytes_written, email_bytes=StubSMTP.sent[-1])
+        sb.mailer.close()
+
+
+def bench_aura(size, repeats, results):
+    """Aura updater: export parsing and the cost fill."""
+    rng = random.Random(size)
+    catalog_size = size * SB_ROWS_PER_PURCHASE
+    aura_bytes = synthetic.aura_csv(synthetic.make_aura(size * AURA_ROWS_PER_PURCHASE, rng, catalog_size))
+    cost_sheet = synthetic.make_purchase_sheet(size, rng, catalog_size)
+    cost_sheet["COGS"] = pd.to_numeric(cost_sheet["COGS"].str.replace("$", "", regex=False), errors="coerce")
+
+    seconds, aura_df = best_of(lambda _: pd.read_csv(BytesIO(aura_bytes)), repeats)
+    record(results, "aura.read_csv", size, len(aura_df), seconds, bytes=len(aura_bytes))
+
+    seconds, updated_rows = best_of(
+        lambda df: fill_missing_costs(df, first_cogs_by_asin(cost_sheet)), repeats, setup=aura_df.copy
+    )
+    record(results, "aura.fill", size, len(aura_df), seconds, updated_rows=len(updated_rows))
+
+
+def print_results(results, baseline=None):
+    baseline_times = {}
+    if baseline:
+        baseline_times = {(row["stage"], row["size"]): row["seconds"] for row in baseline["results"]}
+    print(f"{'stage':<26} | {'size':>7} | {'rows':>8} | {'best (s)':>9} | {'rows/s':>10} | {'vs baseline':>11}")
+    for row in results:
+        previous = baseline_times.get((row["stage"], row["size"]))
+        change = f"{row['seconds'] / previous:>10.2f}x" if previous else f"{'-':>11}"
+        rate = row["rows_per_second"] if row["rows_per_second"] is not None else "-"
+        print(f"{row['stage']:<26} | {row['size']:>7} | {row['rows']:>8} | {row['seconds']:>9.4f} | {rate:>10} | {change}")
+
+    for row in results:
+        if "import_profile" in row:
+            print(f"\nSlowest imports in {row['stage']} ({row['seconds']:.3f}s):")
+            for entry in row["import_profile"]:
+                print(f"  {entry['cumulative_ms']:>9.1f} ms  {entry['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated purchase sheet sizes")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--template", help="use this Listing Loader template instead of the synthetic one")
+    parser.add_argument("--verbose", action="store_true", help="show the tools' own log output")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    prep = load_prep_lambda()
+    sb = load_sb_updater()
+    if args.template:
+        with open(args.template, "rb") as f:
+            template_bytes = f.read()
+    else:
+        template_bytes = synthetic.listing_loader_template(sb.LISTING_LOADER_COLUMNS)
+
+    results = []
+    profile_cold_start("prep", PREP_LAMBDA_PATH, results)
+    profile_cold_start("sb", SB_UPDATER_PATH, results)
+    for size in sizes:
+        print(f"Benchmarking {size} purchase rows...")
+        with nullcontext() if args.verbose else redirect_stdout(StringIO()):
+            bench_prep(prep, size, args.repeats, results)
+            bench_sb(sb, size, args.repeats, results, template_bytes)
+            bench_aura(size, args.repeats, results)
+
+    started = datetime.now(timezone.utc)
+    report = {
+        "created": started.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "repeats": args.repeats,
+        "results": results
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, started.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Synthetic inputs for the benchmarks: purchase (leads) sheets, Sellerboard
+catalogs, aura repricer exports and a Listing Loader template. Everything is
+generated from a random.Random so a given size always produces the same data.
+"""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from common.leads_cache import LEADS_COLUMNS
+
+SHEET_DATE_FORMAT = "%m/%d/%Y"
+# Columns in the real Listing Loader "Template" sheet (headers are on row 4)
+TEMPLATE_COLUMNS = 113
+
+
+def make_asin(i):
+    return f"B0{i:08d}"
+
+
+def make_purchase_sheet(n_rows, rng, catalog_size=0, new_share=0.3, start="2025-01-01", days=30):
+    """
+    Builds a purchase sheet the way the Google Sheet export reads it: every value is
+    text, money has a "$" and about a tenth of the rows are "Replen". With a
+    catalog_size, (1 - new_share) of the ASINs come from the Sellerboard catalog.
+    """
+    start = pd.Timestamp(start)
+    rows = []
+    for i in range(n_rows):
+        if catalog_size and rng.random() >= new_share:
+            asin = make_asin(rng.randrange(catalog_size))
+        else:
+            asin = make_asin(catalog_size + rng.randrange(max(n_rows, 1)))
+        date = start + pd.Timedelta(days=rng.randrange(days))
+        rows.append({
+            "Date": date.strftime(SHEET_DATE_FORMAT),
+            "Name": f"Purchased {asin}",
+            "Size/Color": rng.choice(["", "", "Red", "Blue / L"]),
+            "Bundled?": rng.choice(["", "", "", "2", "3"]),
+            "Amount Purchased": str(rng.randrange(1, 24)),
+            "ASIN": asin,
+            "COGS": f"${rng.uniform(2, 60):.2f}",
+            "Sale Price": "Replen" if rng.random() < 0.1 else f"${rng.uniform(10, 900):.2f}",
+            "Prep Notes": rng.choice(["", "", "Bundle of 2", "Fragile"]),
+            "Order #": f"112-{rng.randrange(10**7):07d}-{i:07d}",
+        })
+    return pd.DataFrame(rows, columns=LEADS_COLUMNS)
+
+
+def purchase_sheet_csv(sheet_df):
+    """CSV text as served by the Google Sheet export URL."""
+    return sheet_df.to_csv(index=False)
+
+
+def make_sellerboard(n_rows, rng):
+    """Builds a Sellerboard catalog where roughly a tenth of the costs are missing."""
+    return pd.DataFrame({
+        'ASIN': [make_asin(i) for i in range(n_rows)],
+        'SKU': [f"SKU-{i:08d}" for i in range(n_rows)],
+        'Title': [f"Product {i}" for i in range(n_rows)],
+        'Labels': '#FBA',
+        'Cost': [None if rng.random() < 0.1 else round(rng.uniform(2, 60), 2) for _ in range(n_rows)],
+        'VAT_CATEGORY': 'A_GEN_STANDARD',
+        'Hide': 'NO',
+    })
+
+
+def sellerboard_xlsx(sb_df):
+    """The catalog as the xlsx stored in S3."""
+    buffer = BytesIO()
+    sb_df.to_excel(buffer, index=False, engine='openpyxl')
+    return buffer.getvalue()
+
+
+def make_aura(n_rows, rng, catalog_size, missing_share=0.5):
+    """Builds an aura repricer export over the catalog's ASINs with some costs missing."""
+    asins = [make_asin(rng.randrange(catalog_size)) for _ in range(n_rows)]
+    return pd.DataFrame({
+        "sku": [f"SKU-{i:08d}" for i in range(n_rows)],
+        "asin": asins,
+        "cost": [np.nan if rng.random() < missing_share else round(rng.uniform(2, 60), 2) for _ in asins],
+        "min_price": [round(rng.uniform(10, 50), 2) for _ in asins],
+        "max_price": [round(rng.uniform(50, 200), 2) for _ in asins],
+    })
+
+
+def aura_csv(aura_df):
+    return aura_df.to_csv(index=False).encode("utf-8")
+
+
+def listing_loader_template(columns):
+    """
+    Builds a stand-in for listingLoaderTemplate.xlsm: a few extra sheets and a
+    "Template" sheet whose header row 4 starts with `columns`, padded to the width
+    of the real template.
+    """
+    wb = Workbook()
+    wb.active.title = "Instructions"
+    for name in ["Data Definitions", "Dropdown Lists", "Valid Values"]:
+        sheet = wb.create_sheet(name)
+        for row in range(50):
+            sheet.append([f"{name} {row}-{col}" for col in range(10)])
+    ws = wb.create_sheet("Template")
+    headers = list(columns) + [f"Attribute {i}" for i in range(len(columns), TEMPLATE_COLUMNS)]
+    ws.append(["TemplateType=Offer", "Version=2025.0101"])
+    ws.append(["Listing Loader"])
+    ws.append([f"label_{i}" for i in range(TEMPLATE_COLUMNS)])
+    ws.append(headers)
+    ws.append(["Example"] * TEMPLATE_COLUMNS)
+    ws.append(["Required"] * TEMPLATE_COLUMNS)
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1 @@
+"""Helpers shared by the Prep Uploader, Cost Updater tools and Discord bot."""
@@ -0,0 +1,198 @@
+"""
+Email attachments that stay within SMTP size limits.
+
+CSV attachments larger than ATTACHMENT_ZIP_MIN_KB are zipped (xlsx/xlsm files
+are zip containers already and are attached as is). BytesIO attachments are
+taken with getvalue(), which hands over the buffer without copying it.
+
+If the attachments of one email still add up to more than
+ATTACHMENT_LINK_THRESHOLD_MB, the largest ones are uploaded to S3 and the email
+carries presigned download links for them instead. base64 makes attachments a
+third larger on the wire, so the default 15 MB stays under Gmail's 25 MB limit.
+
+Linked files are written under ATTACHMENT_LINK_PREFIX in the given bucket, which
+should have a lifecycle rule expiring them. A presigned link stops working when
+the credentials that signed it expire, even if ATTACHMENT_LINK_EXPIRY_HOURS is
+longer. A Lambda role's credentials are temporary, so set
+ATTACHMENT_LINK_ACCESS_KEY_ID and ATTACHMENT_LINK_SECRET_ACCESS_KEY (e.g. an IAM
+user that can only read ATTACHMENT_LINK_PREFIX) to sign links that last the full
+ATTACHMENT_LINK_EXPIRY_HOURS. The email states when its links expire.
+"""
+import html
+import os
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+import boto3
+
+from common.metrics import StageMetrics
+from common.storage import get_s3_client, write_bytes
+
+ATTACHMENT_ZIP_MIN_KB = int(os.getenv("ATTACHMENT_ZIP_MIN_KB", "100"))
+ATTACHMENT_LINK_THRESHOLD_MB = float(os.getenv("ATTACHMENT_LINK_THRESHOLD_MB", "15"))
+# Presigned S3 links are valid for at most 7 days
+ATTACHMENT_LINK_EXPIRY_HOURS = min(int(os.getenv("ATTACHMENT_LINK_EXPIRY_HOURS", "72")), 168)
+ATTACHMENT_LINK_PREFIX = "email_attachments"
+# Long-lived keys used only to sign download links; without them the caller's credentials sign
+ATTACHMENT_LINK_ACCESS_KEY_ID = os.getenv("ATTACHMENT_LINK_ACCESS_KEY_ID")
+ATTACHMENT_LINK_SECRET_ACCESS_KEY = os.getenv("ATTACHMENT_LINK_SECRET_ACCESS_KEY")
+
+# Content types of the files the tools send; anything else is a generic download
+CONTENT_TYPES = {
+    ".csv": ("text", "csv"),
+    ".zip": ("application", "zip"),
+    ".xlsx": ("application", "vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    ".xlsm": ("application", "vnd.ms-excel.sheet.macroEnabled.12"),
+}
+
+
+def attachment_bytes(data):
+    """An attachment's data as bytes; a BytesIO's buffer is shared rather than copied."""
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    if isinstance(data, BytesIO):
+        return data.getvalue()
+    return data
+
+
+def zip_file(data, filename):
+    """A zip archive holding `data` as `filename`."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(filename, data)
+    return buffer.getvalue()
+
+
+def content_type(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return CONTENT_TYPES.get(extension, ("application", "octet-stream"))
+
+
+def link_signing_client():
+    """The S3 client that signs download links: the dedicated link keys if set, else the default client."""
+    if ATTACHMENT_LINK_ACCESS_KEY_ID and ATTACHMENT_LINK_SECRET_ACCESS_KEY:
+        return get_s3_client(
+            aws_access_key_id=ATTACHMENT_LINK_ACCESS_KEY_ID,
+            aws_secret_access_key=ATTACHMENT_LINK_SECRET_ACCESS_KEY
+        )
+    return get_s3_client()
+
+
+def link_expiry():
+    """
+    When links signed now stop working, as (expires_at, known). expires_at is
+    ATTACHMENT_LINK_EXPIRY_HOURS from now. known is False when the signing
+    credentials are temporary (e.g. a Lambda role's) or can't be checked, since
+    the links then also stop working when those credentials expire.
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=ATTACHMENT_LINK_EXPIRY_HOURS)
+    if ATTACHMENT_LINK_ACCESS_KEY_ID and ATTACHMENT_LINK_SECRET_ACCESS_KEY:
+        return expires_at, True
+    try:
+        credentials = boto3.Session().get_credentials()
+        long_lived = credentials is not None and not credentials.get_frozen_credentials().token
+    except Exception as e:
+        print(f"Could not check the credentials signing download links: {e}")
+        long_lived = False
+    return expires_at, long_lived
+
+
+def expiry_text():
+    """The sentence telling recipients until when the links work."""
+    expires_at, known = link_expiry()
+    deadline = expires_at.strftime("%Y-%m-%d %H:%M UTC")
+    if known:
+        return f"Download them before {deadline}:"
+    return (
+        f"Download them soon: the links stop working when the sender's AWS credentials "
+        f"expire, and at {deadline} at the latest:"
+    )
+
+
+def upload_link(bucket, data, filename):
+    """Uploads a file under ATTACHMENT_LINK_PREFIX and returns a presigned download URL."""
+    key = f"{ATTACHMENT_LINK_PREFIX}/{time.strftime('%Y-%m-%d')}/{uuid.uuid4().hex}/{filename}"
+    write_bytes(bucket, key, data)
+    return link_signing_client().generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": bucket,
+            "Key": key,
+            "ResponseContentDisposition": f'attachment; filename="{filename}"'
+        },
+        ExpiresIn=ATTACHMENT_LINK_EXPIRY_HOURS * 3600
+    )
+
+
+def prepare_attachments(attachments, link_bucket=None, metrics=None):
+    """
+    Compresses and sizes an email's attachments, given as (data, filename) pairs
+    where data is bytes, str or a BytesIO. Returns (files, links): the files to
+    attach as (data, filename) and, when they would exceed the size threshold and
+    a link_bucket is given, (filename, url) links for the files moved to S3.
+    A file that fails to prepare or upload is left out, so the email still goes
+    out with the others.
+    """
+    metrics = metrics or StageMetrics()
+    files = []
+    for data, filename in attachments:
+        try:
+            data = attachment_bytes(data)
+            if filename.lower().endswith(".csv") and len(data) >= ATTACHMENT_ZIP_MIN_KB * 1024:
+                with metrics.stage("attachment_zip"):
+                    data = zip_file(data, filename)
+                filename += ".zip"
+        except Exception as e:
+            print(f"Failed to prepare attachment {filename}: {e}")
+            continue
+        files.append((data, filename))
+
+    links = []
+    threshold = ATTACHMENT_LINK_THRESHOLD_MB * 1024 * 1024
+    total = sum(len(data) for data, _ in files)
+    if link_bucket and total > threshold:
+        # Move the largest files to S3 until the rest fit in the email
+        moved = set()
+        for data, filename in sorted(files, key=lambda file: len(file[0]), reverse=True):
+            if total <= threshold:
+                break
+            try:
+                with metrics.stage("attachment_upload"):
+                    links.append((filename, upload_link(link_bucket, data, filename)))
+                metrics.count("attachment_link_bytes", len(data))
+            except Exception as e:
+                # Still too large to attach, so it is left out
+                print(f"Failed to upload {filename} as a download link: {e}")
+            moved.add(filename)
+            total -= len(data)
+        files = [(data, filename) for data, filename in files if filename not in moved]
+    metrics.count("attachment_bytes", total)
+    return files, links
+
+
+def add_attachments(msg, files):
+    """Adds prepared (data, filename) files to an EmailMessage."""
+    for data, filename in files:
+        maintype, subtype = content_type(filename)
+        msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+
+
+def links_text(links):
+    """Plain-text paragraph listing download links, or "" if there are none."""
+    if not links:
+        return ""
+    lines = [f"- {filename}: {url}" for filename, url in links]
+    return f"\n\nThese files were too large to attach. {expiry_text()}\n" + "\n".join(lines)
+
+
+def links_html(links):
+    """HTML paragraph listing download links, or "" if there are none."""
+    if not links:
+        return ""
+    items = "".join(
+        f'<li><a href="{html.escape(url)}">{html.escape(filename)}</a></li>' for filename, url in links
+    )
+    return f"<p>These files were too large to attach. {html.escape(expiry_text())}</p>\n<ul>{items}</ul>\n"
@@ -0,0 +1,39 @@
+"""
+Cost fill for Aura repricer exports, shared by the Aura updater and the Discord bot.
+"""
+import pandas as pd
+
+
+def first_cogs_by_asin(sheet_df):
+    """
+    Maps each ASIN to the COGS of its first row in the cost sheet. Later rows for the
+    same ASIN are ignored, even when the first row has no COGS.
+    """
+    first_rows = sheet_df.drop_duplicates(subset='ASIN', keep='first')
+    return pd.Series(first_rows['COGS'].to_numpy(), index=first_rows['ASIN'].to_numpy())
+
+
+def fill_missing_costs(aura_df, cogs_by_asin):
+    """
+    Fills missing `cost` values in aura_df (in place) from an ASIN -> COGS map in a
+    single vectorized lookup. Returns the list of updated rows for the summary.
+    """
+    candidate_costs = aura_df['asin'].map(cogs_by_asin)
+    fill_mask = aura_df['cost'].isna() & candidate_costs.notna()
+    if not fill_mask.any():
+        return []
+
+    new_costs = candidate_costs[fill_mask].astype(float)
+    updated_rows = [
+        {
+            'index': index,
+            'asin': asin,
+            'old_cost': old_cost,
+            'new_cost': new_cost
+        }
+        for index, asin, old_cost, new_cost in zip(
+            new_costs.index, aura_df.loc[fill_mask, 'asin'], aura_df.loc[fill_mask, 'cost'], new_costs
+        )
+    ]
+    aura_df.loc[fill_mask, 'cost'] = new_costs
+    return updated_rows
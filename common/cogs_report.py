@@ -0,0 +1,147 @@
+"""
+HTML body and CSV detail of the Sellerboard updater's COGS report email.
+
+The HTML is collected as a list of pieces and joined once, and the cell styles
+live in one <style> block instead of on every cell. Each table shows at most
+REPORT_MAX_ROWS rows; when a table is cut, the full detail of every table goes
+into a CSV attachment, so large runs don't produce multi-megabyte emails that
+Gmail clips (it cuts HTML bodies after about 102 KB).
+"""
+import csv
+import html
+import os
+from io import StringIO
+
+from common.attachments import links_html
+
+# Rows shown per report table; the rest are only in the CSV attachment
+REPORT_MAX_ROWS = int(os.getenv("REPORT_MAX_ROWS", "50"))
+REPORT_CSV_FILENAME = "cogs_report.csv"
+
+REPORT_HEAD = """<html>
+<head>
+<style>
+table { border-collapse: collapse; width: 100%; margin-bottom: 20px; }
+th, td { padding: 12px; border: 1px solid #ddd; }
+th { background-color: #f8f9fa; }
+td.increase { color: #e74c3c; }
+td.decrease { color: #27ae60; }
+</style>
+</head>
+<body>
+<h2 style="color: #2c3e50;">Amazon New Listings & COGS Report</h2>
+<div style="margin-bottom: 30px;">
+"""
+REPORT_FOOTER = """</div>
+<p style="color: #7f8c8d;">
+Note: Potential COGS updates are suggestions only. No actual changes have been made to existing items.
+<br>Attached files contain new product listings and updated prices within Sellerboard.
+</p>
+</body>
+</html>"""
+CSV_HEADER = ["Section", "ASIN", "SKU", "Name", "Old Cost", "New Cost", "Difference"]
+
+
+def completed_update_cells(update):
+    return [update['ASIN'], update['SKU'], update['Name'], f"${update['new_cost']:.2f}"]
+
+
+def potential_update_cells(update):
+    diff = update['new_cost'] - update['old_cost']
+    return [
+        update['ASIN'], update['SKU'], update['Name'],
+        f"${update['old_cost']:.2f}", f"${update['new_cost']:.2f}",
+        (f"{diff:+.2f}", "increase" if diff > 0 else "decrease")
+    ]
+
+
+def new_product_cells(product):
+    return [product['ASIN'], product['SKU'], product['Name'], f"${product['cost']:.2f}"]
+
+
+# (title, column headers, cells of one row) of each report table, in email order
+REPORT_TABLES = [
+    ("Completed Cost Updates", ["ASIN", "SKU", "Name", "New Cost"], completed_update_cells),
+    ("Potential COGS Updates", ["ASIN", "SKU", "Name", "Old Cost", "New Cost", "Difference"], potential_update_cells),
+    ("New Products Added", ["ASIN", "SKU", "Name", "Initial Cost"], new_product_cells),
+]
+
+
+def render_cell(cell):
+    """A <td> for a cell value, or for a (value, css class) pair."""
+    if isinstance(cell, tuple):
+        value, css_class = cell
+        return f'<td class="{css_class}">{html.escape(str(value))}</td>'
+    return f"<td>{html.escape(str(cell))}</td>"
+
+
+def report_detail(files, links):
+    """
+    Where the report CSV went, from prepare_attachments()' files and links:
+    its name with "attached to this email" or "linked below", or None if it wasn't sent.
+    """
+    for _, filename in files:
+        if filename.startswith(REPORT_CSV_FILENAME):
+            return f"{filename}, attached to this email"
+    for filename, _ in links:
+        if filename.startswith(REPORT_CSV_FILENAME):
+            return f"{filename}, linked below"
+    return None
+
+
+def render_table(parts, title, columns, cells, rows, max_rows, detail=None):
+    """Appends one table's HTML to `parts`; `detail` is where the cut rows are (see report_detail)."""
+    parts.append(f'<h3 style="color: #34495e;">{title}</h3>\n<table>\n<tr>')
+    parts.extend(f"<th>{column}</th>" for column in columns)
+    parts.append("</tr>\n")
+    for row in rows[:max_rows]:
+        parts.append("<tr>")
+        parts.extend(render_cell(cell) for cell in cells(row))
+        parts.append("</tr>\n")
+    parts.append("</table>\n")
+    if len(rows) > max_rows:
+        where = f"Every row is in {detail}." if detail else "The full detail could not be sent with this email."
+        parts.append(f"<p>Showing the first {max_rows} of {len(rows)} rows. {html.escape(where)}</p>\n")
+
+
+def report_truncated(actual_updates, potential_updates, new_products, max_rows=REPORT_MAX_ROWS):
+    """True if any table is cut at max_rows, in which case report_csv() should be attached."""
+    return any(len(rows) > max_rows for rows in [actual_updates, potential_updates, new_products])
+
+
+def render_report(actual_updates, potential_updates, new_products, links=(), max_rows=REPORT_MAX_ROWS, detail=None):
+    """
+    Builds the report's HTML body in one pass. `links` are (filename, url) pairs
+    of attachments that were sent as download links instead, and `detail` says
+    where the report CSV went when a table is cut (see report_detail).
+    """
+    parts = [REPORT_HEAD]
+    for (title, columns, cells), rows in zip(REPORT_TABLES, [actual_updates, potential_updates, new_products]):
+        if rows:
+            render_table(parts, title, columns, cells, rows, max_rows, detail)
+    parts.append(links_html(links))
+    parts.append(REPORT_FOOTER)
+    return "".join(parts)
+
+
+def report_csv(actual_updates, potential_updates, new_products):
+    """Every row of every report table as CSV bytes, one "Section" per table."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    writer.writerows(
+        ["Completed cost update", u['ASIN'], u['SKU'], u['Name'], "", f"{u['new_cost']:.2f}", ""]
+        for u in actual_updates
+    )
+    writer.writerows(
+        [
+            "Potential COGS update", u['ASIN'], u['SKU'], u['Name'],
+            f"{u['old_cost']:.2f}", f"{u['new_cost']:.2f}", f"{u['new_cost'] - u['old_cost']:+.2f}"
+        ]
+        for u in potential_updates
+    )
+    writer.writerows(
+        ["New product", p['ASIN'], p['SKU'], p['Name'], "", f"{p['cost']:.2f}", ""]
+        for p in new_products
+    )
+    return buffer.getvalue().encode("utf-8")
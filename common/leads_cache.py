@@ -0,0 +1,286 @@
+"""
+Shared cache of normalized purchase (leads) sheets.
+
+The Prep Uploader and the Sellerboard updater read the same purchase sheets on
+the same schedule. The first pipeline to need a sheet downloads and parses it,
+normalizes it (common.leads_csv.normalize_leads) and stores the typed frame as
+Parquet, stamped with the sheet's content hash, when it was fetched, the
+earliest date it holds and which pipeline wrote it. The other pipeline reads
+that frame instead of downloading and parsing the sheet again, as long as the
+entry is younger than LEADS_CACHE_MAX_AGE and holds every row from its own
+watermark. That pipeline can therefore see a sheet up to LEADS_CACHE_MAX_AGE
+(30 minutes by default) stale; rows added since are picked up once the entry
+expires. A pipeline never reads its own entries, so its reruns always check
+the sheet itself.
+
+Which sheet versions each pipeline has already processed is still tracked by
+that pipeline's SheetCache. Entries are stored in S3 or, when LEADS_CACHE_DIR is
+set, in a local directory. Parquet needs pyarrow; without it (or with
+LEADS_CACHE_MAX_AGE=0) every pipeline parses its own download. pandas is only
+imported once a sheet actually has to be read.
+"""
+import importlib.util
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from io import BytesIO, StringIO
+
+from common.metrics import StageMetrics
+from common.sheet_cache import url_key
+from common.sheet_client import content_hash, deadline_passed, fetch_sheet_if_changed, fetch_sheet_text
+from common.storage import get_s3_client, write_bytes
+
+LEADS_CACHE_PREFIX = "leads_cache"
+# Seconds an entry is served to the other pipeline; 0 turns the shared cache off
+LEADS_CACHE_MAX_AGE = float(os.getenv("LEADS_CACHE_MAX_AGE", "1800"))
+# Days of rows kept before the writer's watermark, so the other pipeline's is covered too
+LEADS_CACHE_LOOKBACK_DAYS = int(os.getenv("LEADS_CACHE_LOOKBACK_DAYS", "14"))
+LEADS_CACHE_ENABLED = importlib.util.find_spec("pyarrow") is not None and LEADS_CACHE_MAX_AGE > 0
+# Layout of the cached frames; entries stamped with another schema are refetched
+LEADS_CACHE_SCHEMA = "2"
+# Purchase sheet columns used by either pipeline (and prep_upload_v1); the rest of the sheet is not parsed
+LEADS_COLUMNS = [
+    "Date", "Name", "Size/Color", "Bundled?", "Amount Purchased",
+    "ASIN", "COGS", "Sale Price", "Prep Notes", "Order #"
+]
+
+
+def date_string(value):
+    """YYYY-MM-DD of a date string or Timestamp; these compare correctly as strings."""
+    return str(value)[:10]
+
+
+class LeadsCache(ABC):
+    """
+    Normalized leads frames keyed by sheet URL, as seen by one pipeline ("prep"
+    or "sb"). Each entry's stamp holds the sheet's "content-hash", its
+    "fetched-at" time (epoch seconds), the earliest "since" date the frame
+    covers, the "pipeline" that wrote it and the LEADS_CACHE_SCHEMA it was
+    written with.
+    """
+
+    def __init__(self, pipeline, max_age=LEADS_CACHE_MAX_AGE):
+        self.pipeline = pipeline
+        self.max_age = max_age
+
+    @abstractmethod
+    def _read_stamp(self, name):
+        """Returns an entry's stamp, or None if there is no entry."""
+
+    @abstractmethod
+    def _read_entry(self, name):
+        """Returns an entry's Parquet bytes and its stamp."""
+
+    @abstractmethod
+    def _write_entry(self, name, data, stamp):
+        """Stores an entry's Parquet bytes with its stamp."""
+
+    def fresh_stamp(self, url, since):
+        """
+        The stamp of the entry for `url` if the other pipeline wrote it, it is
+        fresh and it covers `since`, otherwise None.
+        """
+        try:
+            stamp = self._read_stamp(url_key(url))
+        except Exception as e:
+            print(f"Leads cache unavailable ({e}); fetching the sheet.")
+            return None
+        if not stamp or stamp.get("schema") != LEADS_CACHE_SCHEMA:
+            return None
+        if stamp.get("pipeline") == self.pipeline:
+            # This pipeline's own parse; a rerun must look at the sheet again
+            return None
+        if time.time() - float(stamp["fetched-at"]) > self.max_age:
+            return None
+        if stamp["since"] > date_string(since):
+            return None
+        return stamp
+
+    def read(self, url, since):
+        """Returns the entry's rows dated on or after `since` and its content hash, or None."""
+        import pandas as pd
+
+        try:
+            data, stamp = self._read_entry(url_key(url))
+            leads_df = pd.read_parquet(BytesIO(data))
+        except Exception as e:
+            print(f"Error reading leads cache ({e}); fetching the sheet.")
+            return None
+        if not stamp.get("content-hash"):
+            return None
+        return leads_df[leads_df["Date"] >= pd.to_datetime(since)], stamp["content-hash"]
+
+    def write(self, url, leads_df, sheet_hash, since):
+        """Stores a normalized frame holding every row of the sheet from `since`."""
+        stamp = {
+            "content-hash": sheet_hash,
+            "fetched-at": str(int(time.time())),
+            "since": date_string(since),
+            "pipeline": self.pipeline,
+            "schema": LEADS_CACHE_SCHEMA
+        }
+        try:
+            buffer = BytesIO()
+            leads_df.to_parquet(buffer, index=False)
+            self._write_entry(url_key(url), buffer.getvalue(), stamp)
+        except Exception as e:
+            print(f"Error saving leads cache: {e}")
+
+
+class LocalLeadsCache(LeadsCache):
+    """Leads cache stored as Parquet files with JSON stamps in a local directory."""
+
+    def __init__(self, directory, pipeline, max_age=LEADS_CACHE_MAX_AGE):
+        self.directory = directory
+        super().__init__(pipeline, max_age)
+
+    def _path(self, name, extension):
+        return os.path.join(self.directory, name + extension)
+
+    def _read_stamp(self, name):
+        path = self._path(name, ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _read_entry(self, name):
+        with open(self._path(name, ".parquet"), "rb") as f:
+            data = f.read()
+        return data, self._read_stamp(name) or {}
+
+    def _write_entry(self, name, data, stamp):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(name, ".parquet"), "wb") as f:
+            f.write(data)
+        # Written last, so a stamp never points at a missing or older frame
+        with open(self._path(name, ".json"), "w") as f:
+            json.dump(stamp, f)
+
+
+class S3LeadsCache(LeadsCache):
+    """Leads cache stored as Parquet objects in S3, stamped through object metadata."""
+
+    def __init__(self, bucket, pipeline, prefix=LEADS_CACHE_PREFIX, max_age=LEADS_CACHE_MAX_AGE):
+        self.bucket = bucket
+        self.prefix = prefix
+        super().__init__(pipeline, max_age)
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}.parquet"
+
+    def _read_stamp(self, name):
+        try:
+            response = get_s3_client().head_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception:
+            # No entry for this sheet yet
+            return None
+        return response.get("Metadata", {})
+
+    def _read_entry(self, name):
+        # The stamp is re-read with the body so both come from the same object version
+        response = get_s3_client().get_object(Bucket=self.bucket, Key=self._key(name))
+        return response["Body"].read(), response.get("Metadata", {})
+
+    def _write_entry(self, name, data, stamp):
+        write_bytes(self.bucket, self._key(name), data, metadata=stamp)
+
+
+def get_leads_cache(bucket, pipeline):
+    """
+    Returns the shared leads cache as seen by `pipeline` ("prep" or "sb"): a local
+    directory when LEADS_CACHE_DIR is set
+    (tools and local runs), otherwise objects in the config bucket. Returns None
+    when the cache is turned off or pyarrow is not installed.
+    """
+    if not LEADS_CACHE_ENABLED:
+        return None
+    cache_dir = os.getenv("LEADS_CACHE_DIR")
+    if cache_dir:
+        return LocalLeadsCache(cache_dir, pipeline)
+    return S3LeadsCache(bucket, pipeline)
+
+
+def parse_leads(csv_text, since, lookback_days=0):
+    """
+    Parses and normalizes a leads CSV: rows of LEADS_COLUMNS dated on or after
+    `since` minus `lookback_days`, or the whole sheet when `since` is None.
+    Returns the DataFrame and the earliest date it covers.
+    """
+    import pandas as pd
+    from common.leads_csv import normalize_leads, read_recent_leads
+
+    if since is None:
+        return normalize_leads(pd.read_csv(StringIO(csv_text), dtype=str)), None
+    parse_since = pd.to_datetime(since) - pd.Timedelta(days=lookback_days)
+    leads_df = read_recent_leads(csv_text, parse_since, columns=LEADS_COLUMNS)
+    return normalize_leads(leads_df), parse_since
+
+
+def check_deadline(deadline):
+    """Raises requests' Timeout once the caller's deadline has passed."""
+    if deadline_passed(deadline):
+        import requests
+
+        raise requests.exceptions.Timeout("Sheet fetch abandoned at the deadline")
+
+
+def fetch_leads(url, since, sheet_cache=None, leads_cache=None, timeout=None, metrics=None, deadline=None):
+    """
+    Returns the normalized rows of a purchase sheet dated on or after `since`.
+
+    A fresh leads_cache entry is used when there is one. Otherwise the sheet is
+    downloaded and parsed with LEADS_CACHE_LOOKBACK_DAYS of extra history, and the
+    frame is written to leads_cache for the other pipeline. With a sheet_cache,
+    returns None (without reading any rows) if this version of the sheet was
+    already processed by the calling pipeline. With since=None the whole sheet is
+    parsed and nothing is cached.
+
+    With a `deadline` (a time.monotonic() value), a fetch still running then
+    raises requests' Timeout and writes nothing to either cache, so a fetch its
+    caller has given up on has no side effects.
+    """
+    metrics = metrics or StageMetrics()
+    if since is None:
+        leads_cache = None
+
+    if leads_cache is not None:
+        with metrics.stage("leads_cache_read"):
+            stamp = leads_cache.fresh_stamp(url, since)
+        if stamp is not None:
+            if sheet_cache is not None and sheet_cache.is_processed(url, stamp["content-hash"]):
+                return None
+            with metrics.stage("leads_cache_read"):
+                cached = leads_cache.read(url, since)
+            if cached is not None:
+                leads_df, sheet_hash = cached
+                check_deadline(deadline)
+                if sheet_cache is not None:
+                    sheet_cache.remember(url, sheet_hash)
+                metrics.count("leads_cache_hits", 1)
+                metrics.count("rows_read", len(leads_df))
+                return leads_df
+
+    with metrics.stage("sheet_fetch"):
+        if sheet_cache is None:
+            csv_text = fetch_sheet_text(url, timeout=timeout, deadline=deadline)
+        else:
+            csv_text = fetch_sheet_if_changed(url, sheet_cache, timeout=timeout, deadline=deadline)
+    if csv_text is None:
+        return None
+    metrics.count("sheet_bytes", len(csv_text.encode("utf-8")))
+    lookback_days = LEADS_CACHE_LOOKBACK_DAYS if leads_cache is not None else 0
+    with metrics.stage("parse"):
+        leads_df, parsed_since = parse_leads(csv_text, since, lookback_days)
+    metrics.count("rows_parsed", len(leads_df))
+
+    if leads_cache is not None:
+        import pandas as pd
+
+        check_deadline(deadline)
+        with metrics.stage("leads_cache_write"):
+            leads_cache.write(url, leads_df, content_hash(csv_text), parsed_since)
+        leads_df = leads_df[leads_df["Date"] >= pd.to_datetime(since)]
+    metrics.count("rows_read", len(leads_df))
+    return leads_df
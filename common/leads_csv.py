@@ -0,0 +1,82 @@
+"""
+Date-pruned parsing of purchase (leads) sheet CSV exports.
+
+Buy sheets keep years of purchase history while each scheduled run only
+needs the rows on or after the watermark date. The CSV is parsed in chunks
+with only the needed columns, and older rows are dropped chunk by chunk, so
+the DataFrames held in memory grow with the number of new rows rather than
+the length of the sheet. normalize_leads() then types the Date, COGS and
+Sale Price columns once for every pipeline, keeping the sheet's COGS text
+for files that pass it on as written.
+"""
+import os
+from io import StringIO
+
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+LEADS_CHUNK_SIZE = int(os.getenv("LEADS_CHUNK_SIZE", "5000"))
+# strftime-style format of the sheet's Date column; guessed from the data when unset
+SHEET_DATE_FORMAT = os.getenv("SHEET_DATE_FORMAT") or None
+# The sheet's COGS text ("$1,234.50", "N/A"), kept next to the numeric COGS
+COGS_TEXT_COLUMN = "COGS Text"
+
+
+def read_recent_leads(csv_text, since, columns=None, chunksize=LEADS_CHUNK_SIZE, date_format=SHEET_DATE_FORMAT):
+    """
+    Parses a leads CSV keeping only rows whose Date is on or after `since`.
+    `columns` limits parsing to those columns (missing ones are ignored; Date is
+    always read). All values are read as text except Date, which is returned
+    parsed, with unparseable dates dropped like any other old row.
+    """
+    usecols = None
+    if columns is not None:
+        wanted = set(columns) | {"Date"}
+        usecols = lambda column: column in wanted  # noqa: E731
+    since = pd.to_datetime(since)
+
+    kept_chunks = []
+    header = None
+    for chunk in pd.read_csv(StringIO(csv_text), dtype=str, usecols=usecols, chunksize=chunksize):
+        header = chunk.columns
+        if date_format is None:
+            # Fix the format from the first real date so every chunk parses the same way
+            first_date = chunk["Date"].dropna()
+            if not first_date.empty:
+                date_format = guess_datetime_format(first_date.iloc[0])
+        dates = pd.to_datetime(chunk["Date"], format=date_format, errors="coerce")
+        recent = dates >= since
+        if recent.any():
+            chunk = chunk[recent].copy()
+            chunk["Date"] = dates[recent]
+            kept_chunks.append(chunk)
+
+    if kept_chunks:
+        return pd.concat(kept_chunks)
+    if header is None:
+        header = pd.read_csv(StringIO(csv_text), dtype=str, usecols=usecols, nrows=0).columns
+    empty = pd.DataFrame(columns=header, dtype=str)
+    empty["Date"] = pd.to_datetime(empty["Date"])
+    return empty
+
+
+def normalize_leads(leads_df):
+    """
+    Cleans the columns both pipelines compute with, in place: Date is parsed,
+    COGS becomes a float (NaN if not a number), with the original text kept in
+    COGS_TEXT_COLUMN, and Sale Price loses "$", "," and surrounding spaces
+    while staying text, so "Replen" is kept as is. Returns the DataFrame.
+    """
+    leads_df["Date"] = pd.to_datetime(leads_df["Date"], errors="coerce")
+    if "COGS" in leads_df.columns:
+        leads_df[COGS_TEXT_COLUMN] = leads_df["COGS"]
+        cogs = leads_df["COGS"].astype(str).str.replace(r"[\$,]", "", regex=True).str.strip()
+        leads_df["COGS"] = pd.to_numeric(cogs, errors="coerce")
+    if "Sale Price" in leads_df.columns:
+        leads_df["Sale Price"] = (
+            leads_df["Sale Price"]
+            .str.replace("$", "", regex=False)
+            .str.replace(",", "", regex=False)
+            .str.strip()
+        )
+    return leads_df
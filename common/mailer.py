@@ -0,0 +1,85 @@
+"""
+SMTP delivery over a single reusable connection.
+
+Opening an SMTP_SSL connection and logging in costs a TLS handshake and an
+AUTH round trip, so the Lambdas keep one Mailer per container and send every
+message of an invocation over the same authenticated connection.
+"""
+import smtplib
+import ssl
+import threading
+import time
+
+
+class Mailer:
+    """
+    Sends EmailMessage objects over one lazily opened SMTP_SSL connection.
+    A dropped connection is reopened once per message. Every send attempt is
+    recorded in `results` with its recipient, subject, outcome and latency.
+    """
+
+    def __init__(self, address, password, host="smtp.gmail.com", port=465):
+        self.address = address
+        self.password = password
+        self.host = host
+        self.port = port
+        self.results = []
+        self._server = None
+        # smtplib connections are not thread-safe; sends are serialized
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        context = ssl.create_default_context()
+        server = smtplib.SMTP_SSL(self.host, self.port, context=context)
+        server.login(self.address, self.password)
+        self._server = server
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+    def send(self, msg):
+        """Sends a message, reconnecting once if the server dropped the connection."""
+        with self._lock:
+            result = {"to": msg["To"], "subject": msg["Subject"]}
+            start = time.perf_counter()
+            try:
+                try:
+                    if self._server is None:
+                        self._connect()
+                    self._server.send_message(msg)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    if self._server is not None:
+                        self._server.close()
+                        self._server = None
+                    self._connect()
+                    self._server.send_message(msg)
+                result["ok"] = True
+            except Exception as e:
+                result["ok"] = False
+                result["error"] = str(e)
+                raise
+            finally:
+                result["seconds"] = round(time.perf_counter() - start, 3)
+                self.results.append(result)
+
+    def reset(self):
+        """Clears the per-message results at the start of an invocation."""
+        with self._lock:
+            self.results = []
+
+    def close(self):
+        """Logs out and closes the connection if one is open."""
+        with self._lock:
+            self._disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
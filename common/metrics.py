@@ -0,0 +1,80 @@
+"""
+Per-stage timings and counters for the Lambdas, logged as CloudWatch Embedded
+Metric Format (EMF) lines.
+
+Each user pipeline (and the invocation itself) gets its own StageMetrics. Stage
+times accumulate, so a stage entered twice (e.g. two S3 uploads) reports the
+total. emit() prints one JSON line that CloudWatch turns into metrics, and
+summary() returns the same numbers for the handler's response body.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = "EcommerceTools"
+
+
+def metric_unit(name):
+    if name.endswith("_seconds"):
+        return "Seconds"
+    if name.endswith("_bytes"):
+        return "Bytes"
+    return "Count"
+
+
+class StageMetrics:
+    """
+    Collects `<stage>_seconds` timings and counters (rows, bytes) for one pipeline.
+    `properties` are logged with the metrics (e.g. the user) but are not dimensions.
+    Without a pipeline name the metrics are collected but never emitted.
+    """
+
+    def __init__(self, pipeline=None, **properties):
+        self.pipeline = pipeline
+        self.properties = properties
+        self.seconds = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Times the block and adds it to the stage's total, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_seconds(name, time.perf_counter() - start)
+
+    def add_seconds(self, name, seconds):
+        """Adds time measured elsewhere to a stage."""
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def count(self, name, value):
+        """Adds to a counter; names ending in "_bytes" are reported in bytes."""
+        self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def summary(self):
+        return {
+            "seconds": {name: round(seconds, 3) for name, seconds in self.seconds.items()},
+            "counts": dict(self.counts)
+        }
+
+    def emit(self):
+        """Prints the metrics as a single EMF log line."""
+        if self.pipeline is None or not (self.seconds or self.counts):
+            return
+        values = {f"{name}_seconds": round(seconds, 3) for name, seconds in self.seconds.items()}
+        values.update(self.counts)
+        definitions = [{"Name": name, "Unit": metric_unit(name)} for name in values]
+        print(json.dumps({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Pipeline"]],
+                    "Metrics": definitions
+                }]
+            },
+            "Pipeline": self.pipeline,
+            **self.properties,
+            **values
+        }))
@@ -0,0 +1,93 @@
+"""
+Per-user index of purchase rows that have already been processed.
+
+Each purchase row is identified by a 64-bit fingerprint of its Order #, ASIN,
+Date and quantity. A user's index is stored in S3 as a packed array of
+(fingerprint, day) pairs, 12 bytes per row. Before a run processes a sheet it
+drops the rows already in the index, so the boundary day covered by the date
+watermark is not processed twice and a rerun of the same data is a no-op.
+Entries dated before the watermark can never be read again, so they are pruned
+on save, which keeps the index about as large as the recent rows.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from common.storage import read_bytes, write_bytes
+
+FINGERPRINT_COLUMNS = ["Order #", "ASIN", "Date", "Amount Purchased"]
+ROW_INDEX_DTYPE = np.dtype([("fingerprint", "<u8"), ("day", "<i4")])
+ROW_INDEX_PREFIX = "row_index"
+
+
+def row_fingerprints(leads_df):
+    """64-bit fingerprints of each row's Order #, ASIN, Date and quantity."""
+    parts = {}
+    for column in FINGERPRINT_COLUMNS:
+        if column == "Date":
+            values = pd.to_datetime(leads_df["Date"], errors="coerce").dt.strftime("%Y-%m-%d")
+        elif column in leads_df.columns:
+            values = leads_df[column].astype(object).map(str).str.strip()
+        else:
+            values = pd.Series("", index=leads_df.index)
+        parts[column] = values.astype(object).fillna("")
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy(dtype=np.uint64)
+
+
+def row_days(leads_df):
+    """Each row's Date as days since 1970-01-01."""
+    dates = pd.to_datetime(leads_df["Date"], errors="coerce")
+    return dates.to_numpy(dtype="datetime64[D]").astype(np.int64).astype(np.int32)
+
+
+def row_index_key(pipeline, user_id):
+    """S3 key of one user's index for a pipeline ("prep" or "sb")."""
+    user_hash = hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:16]
+    return f"{ROW_INDEX_PREFIX}/{pipeline}/{user_hash}.bin"
+
+
+class RowIndex:
+    """Processed-row fingerprints for one user of one pipeline, backed by an S3 object."""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        try:
+            self.entries = np.frombuffer(read_bytes(bucket, key), dtype=ROW_INDEX_DTYPE).copy()
+        except Exception:
+            # First run for this user (or unreadable index): nothing is known yet
+            self.entries = np.empty(0, dtype=ROW_INDEX_DTYPE)
+        self._sorted_fingerprints = np.sort(self.entries["fingerprint"])
+
+    def new_rows_mask(self, leads_df):
+        """Boolean mask of the rows in leads_df that are not in the index yet."""
+        if leads_df.empty or self._sorted_fingerprints.size == 0:
+            return np.ones(len(leads_df), dtype=bool)
+        fingerprints = row_fingerprints(leads_df)
+        positions = np.searchsorted(self._sorted_fingerprints, fingerprints)
+        positions = np.minimum(positions, self._sorted_fingerprints.size - 1)
+        return self._sorted_fingerprints[positions] != fingerprints
+
+    def add(self, leads_df):
+        """Records every row of leads_df as processed."""
+        if leads_df.empty:
+            return
+        added = np.empty(len(leads_df), dtype=ROW_INDEX_DTYPE)
+        added["fingerprint"] = row_fingerprints(leads_df)
+        added["day"] = row_days(leads_df)
+        self.entries = np.concatenate([self.entries, added])
+        self._sorted_fingerprints = np.sort(self.entries["fingerprint"])
+
+    def save(self, prune_before=None):
+        """Writes the index to S3, dropping rows dated before prune_before."""
+        entries = self.entries
+        if prune_before is not None:
+            cutoff = np.datetime64(pd.to_datetime(prune_before).date(), "D").astype(np.int64)
+            entries = entries[entries["day"] >= cutoff]
+        _, unique_positions = np.unique(entries["fingerprint"], return_index=True)
+        entries = entries[np.sort(unique_positions)]
+        try:
+            write_bytes(self.bucket, self.key, entries.tobytes())
+        except Exception as e:
+            print(f"Error saving processed-row index {self.key}: {e}")
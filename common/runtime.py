@@ -0,0 +1,42 @@
+"""
+Startup helpers for the Lambda entry points.
+
+The Lambdas keep their module-level imports light (pandas, numpy and openpyxl
+are imported inside the functions that use them) so a container's init only
+pays for what every invocation needs. These helpers skip the .env lookup when
+running in Lambda and report cold starts as metrics.
+"""
+import os
+import time
+
+# Taken when an entry point first imports this module, i.e. at the start of its init
+_init_started = time.perf_counter()
+_first_invocation = True
+
+
+def running_in_lambda():
+    return "AWS_LAMBDA_FUNCTION_NAME" in os.environ
+
+
+def load_local_env():
+    """
+    Loads a local .env file. Skipped in Lambda, where the configuration comes from
+    the function's environment and python-dotenv need not even be imported.
+    """
+    if running_in_lambda():
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def record_cold_start(metrics):
+    """
+    On a container's first invocation, counts a cold start and records the time
+    from the start of module init to the handler call as the "init" stage.
+    """
+    global _first_invocation
+    if not _first_invocation:
+        return
+    _first_invocation = False
+    metrics.count("cold_starts", 1)
+    metrics.add_seconds("init", time.perf_counter() - _init_started)
@@ -0,0 +1,142 @@
+"""
+Per-URL record of the Google Sheet versions that have already been processed.
+
+For every sheet URL the cache keeps the HTTP validators (ETag / Last-Modified)
+and a SHA-256 of the CSV body from the last fully processed download. The next
+run sends a conditional request and compares hashes, so an unchanged sheet can
+be skipped before any pandas parsing or conversion happens.
+
+The whole index is a single small JSON document, read once and written once
+per run: a local file for tools run on a workstation, or an S3 object for the
+Lambdas (so the record survives cold starts). Each pipeline keeps its own
+index, since a sheet processed by one pipeline is still new to the other.
+"""
+import hashlib
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+
+from common.storage import read_json, write_json
+
+SHEET_CACHE_PREFIX = "sheet_cache"
+
+
+def sheet_cache_key(pipeline):
+    """Key (or file name) of a pipeline's index ("prep" or "sb")."""
+    return f"{SHEET_CACHE_PREFIX}/{pipeline}.json"
+
+
+def url_key(url):
+    """Index key for a sheet URL (hashed so sheet links aren't stored in plain text)."""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class SheetCache(ABC):
+    """
+    Holds processed sheet versions plus the versions fetched during this run.
+    A fetched version only becomes "processed" once mark_processed() is
+    called, so a run that fails part-way re-processes the sheet next time.
+    """
+
+    def __init__(self):
+        self._entries = self._read_index()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _read_index(self):
+        """Returns the stored index of processed versions, or {} if there is none."""
+
+    @abstractmethod
+    def _write_index(self, entries):
+        """Stores the index of processed versions."""
+
+    def conditional_headers(self, url):
+        """Request headers that let the server answer 304 if the processed version is current."""
+        entry = self._entries.get(url_key(url), {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_processed(self, url, sheet_hash):
+        """True if this exact sheet content was already processed."""
+        return self._entries.get(url_key(url), {}).get("content_hash") == sheet_hash
+
+    def remember(self, url, sheet_hash, etag=None, last_modified=None):
+        """Records the version fetched in this run until it is marked processed."""
+        with self._lock:
+            self._pending[url_key(url)] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "content_hash": sheet_hash
+            }
+
+    def mark_processed(self, url):
+        """Promotes the version fetched in this run to the processed version."""
+        key = url_key(url)
+        with self._lock:
+            if key in self._pending:
+                self._entries[key] = self._pending.pop(key)
+
+    def save(self):
+        """Writes the processed versions back to the cache store."""
+        with self._lock:
+            self._write_index(dict(self._entries))
+
+
+class LocalSheetCache(SheetCache):
+    """Sheet cache stored as a JSON file on local disk."""
+
+    def __init__(self, path):
+        self.path = path
+        super().__init__()
+
+    def _read_index(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _write_index(self, entries):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(entries, f, indent=4)
+
+
+class S3SheetCache(SheetCache):
+    """Sheet cache stored as a JSON object in S3."""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        super().__init__()
+
+    def _read_index(self):
+        try:
+            return read_json(self.bucket, self.key)
+        except Exception as e:
+            print(f"No sheet cache loaded ({e}); all sheets will be processed.")
+            return {}
+
+    def _write_index(self, entries):
+        try:
+            write_json(self.bucket, self.key, entries)
+        except Exception as e:
+            print(f"Error saving sheet cache: {e}")
+
+
+def get_sheet_cache(bucket, pipeline):
+    """
+    Returns a pipeline's sheet cache for this run: a local file when
+    SHEET_CACHE_DIR is set (tools and local runs), otherwise an object in the
+    config bucket.
+    """
+    key = sheet_cache_key(pipeline)
+    cache_dir = os.getenv("SHEET_CACHE_DIR")
+    if cache_dir:
+        return LocalSheetCache(os.path.join(cache_dir, key))
+    return S3SheetCache(bucket, key)
@@ -0,0 +1,126 @@
+"""
+Shared HTTP client for downloading Google Sheet CSV exports.
+
+All tools go through one keep-alive requests.Session so repeated fetches to
+docs.google.com reuse pooled connections instead of paying a new TCP/TLS
+handshake each time. Transient failures (429 and 5xx) are retried with
+exponential backoff. Read timeouts are not retried, so a stalled export costs
+one SHEET_READ_TIMEOUT rather than one per attempt. Callers with a wall-clock
+budget pass a `deadline` (a time.monotonic() value); the body is then streamed
+and a download still running at the deadline raises requests' Timeout, so a
+slow trickle of bytes can't keep it going.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Seconds to wait for the connection / for each read from Google
+SHEET_CONNECT_TIMEOUT = float(os.getenv("SHEET_CONNECT_TIMEOUT", "5"))
+SHEET_READ_TIMEOUT = float(os.getenv("SHEET_READ_TIMEOUT", "30"))
+# Retries on 429/5xx; waits 0.5s, 1s, 2s, ... (or the server's Retry-After)
+SHEET_FETCH_RETRIES = int(os.getenv("SHEET_FETCH_RETRIES", "3"))
+SHEET_POOL_SIZE = int(os.getenv("SHEET_POOL_SIZE", "10"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the process-wide sheet session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=SHEET_FETCH_RETRIES,
+                    read=0,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET", "HEAD"],
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=SHEET_POOL_SIZE,
+                    pool_maxsize=SHEET_POOL_SIZE,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Accept-Encoding": "gzip, deflate"})
+                _session = session
+    return _session
+
+
+def deadline_passed(deadline):
+    return deadline is not None and time.monotonic() > deadline
+
+
+def read_text(response, deadline=None):
+    """A response's body as text, raising requests' Timeout if it is still downloading at the deadline."""
+    if deadline is None:
+        return response.text
+    chunks = []
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        if deadline_passed(deadline):
+            response.close()
+            raise requests.exceptions.Timeout("Sheet download did not finish before the deadline")
+        chunks.append(chunk)
+    return b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+
+
+def content_hash(text):
+    """SHA-256 of a sheet's CSV text, used to detect unchanged sheets."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def fetch_sheet_text(url, timeout=None, deadline=None):
+    """
+    Downloads a Google Sheet CSV export and returns its text.
+    Raises requests.exceptions.RequestException on network or HTTP errors, or
+    if the download is still running at the deadline.
+    """
+    if timeout is None:
+        timeout = (SHEET_CONNECT_TIMEOUT, SHEET_READ_TIMEOUT)
+    response = get_session().get(url, timeout=timeout, stream=deadline is not None)
+    response.raise_for_status()
+    return read_text(response, deadline)
+
+
+def fetch_sheet_if_changed(url, sheet_cache, timeout=None, deadline=None):
+    """
+    Downloads a sheet unless it is unchanged since it was last processed.
+    Sends the cached validators as a conditional request; a 304, or a body whose
+    hash matches the processed version, returns None. Otherwise returns the CSV
+    text and records the new version in the cache as pending. Past the deadline
+    it raises requests' Timeout without touching the cache.
+    """
+    if timeout is None:
+        timeout = (SHEET_CONNECT_TIMEOUT, SHEET_READ_TIMEOUT)
+    response = get_session().get(
+        url, headers=sheet_cache.conditional_headers(url), timeout=timeout, stream=deadline is not None
+    )
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+
+    text = read_text(response, deadline)
+    sheet_hash = content_hash(text)
+    already_processed = sheet_cache.is_processed(url, sheet_hash)
+    sheet_cache.remember(
+        url,
+        sheet_hash,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified")
+    )
+    if already_processed:
+        # Same content under new validators; keep them so the next run can get a 304
+        sheet_cache.mark_processed(url)
+        return None
+    return text
@@ -0,0 +1,153 @@
+"""
+Shared S3 access for the Lambdas and the Discord bot.
+
+boto3 clients are expensive to build (credential resolution, endpoint and
+service model loading), so one client per set of arguments is created per
+container and reused by every helper and worker thread.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# Part size and parallelism for streamed multipart uploads (S3 needs parts >= 5 MB)
+S3_UPLOAD_PART_MB = int(os.getenv("S3_UPLOAD_PART_MB", "8"))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_client(**client_kwargs):
+    """
+    Returns the cached S3 client for these boto3.client() keyword arguments,
+    creating it on first use. Creation is locked because boto3's default
+    session is not thread-safe.
+    """
+    cache_key = tuple(sorted(client_kwargs.items()))
+    client = _clients.get(cache_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(cache_key)
+            if client is None:
+                client = boto3.client('s3', **client_kwargs)
+                _clients[cache_key] = client
+    return client
+
+
+def read_bytes(bucket, key):
+    """Downloads an S3 object and returns its body as bytes."""
+    response = get_s3_client().get_object(Bucket=bucket, Key=key)
+    return response['Body'].read()
+
+
+def write_bytes(bucket, key, body, metadata=None):
+    """Uploads bytes (or a str) to S3 and returns the new object's ETag."""
+    extra_args = {"Metadata": metadata} if metadata else {}
+    response = get_s3_client().put_object(Bucket=bucket, Key=key, Body=body, **extra_args)
+    return response.get('ETag')
+
+
+def get_etag(bucket, key):
+    """Returns an S3 object's ETag, or None if the object does not exist."""
+    try:
+        return get_s3_client().head_object(Bucket=bucket, Key=key)['ETag']
+    except Exception:
+        return None
+
+
+def read_json(bucket, key):
+    """Downloads and decodes a JSON object from S3."""
+    return json.loads(read_bytes(bucket, key).decode('utf-8'))
+
+
+def write_json(bucket, key, data):
+    """Encodes data as JSON and uploads it to S3."""
+    write_bytes(bucket, key, json.dumps(data))
+
+
+def iter_parts(chunks, part_size):
+    """
+    Regroups an iterable of byte chunks into part_size pieces (the last one may be
+    shorter). Always yields at least one piece, so an empty stream gives b''.
+    """
+    buffer = bytearray()
+    yielded = False
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+            yielded = True
+    if buffer or not yielded:
+        yield bytes(buffer)
+
+
+def upload_stream(bucket, key, chunks, part_size=None, concurrency=None, s3_client=None):
+    """
+    Uploads an iterable of byte chunks to S3 without holding the whole object in memory.
+
+    Objects that fit in one part go up with a single put_object. Larger ones use a
+    multipart upload with at most `concurrency` parts in flight, so memory stays around
+    (concurrency + 2) * part_size. A failed upload is aborted and the error re-raised.
+    Returns a dict with the bytes sent, the number of parts and the elapsed seconds.
+    """
+    part_size = part_size or S3_UPLOAD_PART_MB * 1024 * 1024
+    concurrency = concurrency or S3_UPLOAD_CONCURRENCY
+    s3_client = s3_client or get_s3_client()
+    start = time.perf_counter()
+
+    parts = iter_parts(chunks, part_size)
+    first_part = next(parts)
+    second_part = next(parts, None)
+    if second_part is None:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=first_part)
+        return {"bytes": len(first_part), "parts": 1, "seconds": time.perf_counter() - start}
+
+    # Hand the two peeked parts over without keeping our own references to them
+    peeked = [first_part, second_part]
+    first_part = second_part = None
+
+    def part_bodies():
+        while peeked:
+            yield peeked.pop(0)
+        yield from parts
+
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+    in_flight = threading.BoundedSemaphore(concurrency)
+    failed = threading.Event()
+
+    def upload_part(part_number, body):
+        try:
+            response = s3_client.upload_part(
+                Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+            )
+            return {"PartNumber": part_number, "ETag": response['ETag']}
+        except Exception:
+            failed.set()
+            raise
+        finally:
+            in_flight.release()
+
+    total_bytes = 0
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for part_number, body in enumerate(part_bodies(), start=1):
+                if failed.is_set():
+                    break
+                in_flight.acquire()
+                total_bytes += len(body)
+                futures.append(executor.submit(upload_part, part_number, body))
+        completed_parts = [future.result() for future in futures]
+        s3_client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": completed_parts}
+        )
+    except BaseException:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    return {"bytes": total_bytes, "parts": len(futures), "seconds": time.perf_counter() - start}